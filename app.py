@@ -4,6 +4,8 @@
 import dash
 import dash_bootstrap_components as dbc
 
+from utils import responses
+
 app = dash.Dash(__name__,
                 external_stylesheets=[dbc.themes.BOOTSTRAP],
                 meta_tags=[{"name": "viewport", "content": "width=device-width"}],
@@ -11,3 +13,12 @@ app = dash.Dash(__name__,
 
 server = app.server
 app.config.suppress_callback_exceptions = True
+
+## Brotli/gzip compression and ETags (304 Not Modified) for callback and layout responses
+responses.enable(app)
+
+
+## Health check for the load balancer - answers without loading any data
+@server.route("/health")
+def health():
+    return "ok"
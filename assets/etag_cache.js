@@ -0,0 +1,59 @@
+// Conditional callback requests (see utils/responses.py)
+//
+// Keeps the latest responses to callback requests with their ETags, keyed by request
+// body, and sends the ETag in If-None-Match when the same request is made again. The
+// server then answers 304 without a body and the kept response is used instead.
+
+const callbackResponses = new Map();
+const callbackResponsesMaxChars = 20 * 1024 * 1024;
+let callbackResponsesChars = 0;
+
+function keepCallbackResponse(body, entry) {
+    const previous = callbackResponses.get(body);
+    if (previous !== undefined) {
+        callbackResponsesChars -= previous.text.length;
+        callbackResponses.delete(body);
+    }
+    if (entry.text.length > callbackResponsesMaxChars) {
+        return;
+    }
+    callbackResponses.set(body, entry);
+    callbackResponsesChars += entry.text.length;
+    // Maps iterate in insertion order: evict the least recently used responses
+    for (const [key, kept] of callbackResponses) {
+        if (callbackResponsesChars <= callbackResponsesMaxChars) {
+            break;
+        }
+        callbackResponses.delete(key);
+        callbackResponsesChars -= kept.text.length;
+    }
+}
+
+const fetchWithoutEtags = window.fetch.bind(window);
+
+window.fetch = function(input, init) {
+    const url = typeof input === "string" ? input : input.url;
+    if (!init || init.method !== "POST" || typeof init.body !== "string" || !url.includes("_dash-update-component")) {
+        return fetchWithoutEtags(input, init);
+    }
+    const body = init.body;
+    const kept = callbackResponses.get(body);
+    const headers = new Headers(init.headers || {});
+    if (kept !== undefined) {
+        headers.set("If-None-Match", kept.etag);
+    }
+    return fetchWithoutEtags(input, Object.assign({}, init, {headers: headers})).then((response) => {
+        if (response.status === 304 && kept !== undefined) {
+            keepCallbackResponse(body, kept);
+            return new Response(kept.text, {status: 200, headers: {"Content-Type": kept.contentType}});
+        }
+        const etag = response.headers.get("ETag");
+        if (response.status !== 200 || !etag) {
+            return response;
+        }
+        return response.clone().text().then((text) => {
+            keepCallbackResponse(body, {etag: etag, text: text, contentType: response.headers.get("Content-Type")});
+            return response;
+        });
+    });
+};
@@ -0,0 +1,34 @@
+// Hover text for heatmaps sent as PNG images (see utils/heatmaps.py)
+//
+// The Store next to each heatmap holds its values as base64 uint8 codes
+// (value = offset + code * scale, 255 for missing values) and the row/column labels.
+
+const heatmapCodes = new WeakMap();
+
+function decodeHeatmapValues(lookup) {
+    let codes = heatmapCodes.get(lookup);
+    if (codes === undefined) {
+        codes = Uint8Array.from(atob(lookup.values), (character) => character.charCodeAt(0));
+        heatmapCodes.set(lookup, codes);
+    }
+    return codes;
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    heatmap: {
+        hover: function(hoverData, lookup) {
+            if (!hoverData || !lookup || !hoverData.points.length) {
+                return "";
+            }
+            const point = hoverData.points[0];
+            const row = Math.round(point.y);
+            const column = Math.round(point.x);
+            if (row < 0 || row >= lookup.rows || column < 0 || column >= lookup.columns) {
+                return "";
+            }
+            const code = decodeHeatmapValues(lookup)[row * lookup.columns + column];
+            const value = code === 255 ? "NaN" : Number((lookup.offset + code * lookup.scale).toPrecision(3));
+            return `${lookup.labels.x}: ${lookup.x[column]} | ${lookup.labels.y}: ${lookup.y[row]} | ${lookup.labels.color}: ${value}`;
+        }
+    }
+});
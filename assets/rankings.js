@@ -0,0 +1,190 @@
+// Ranking and volcano plots drawn in the browser (see utils/bundles.py)
+//
+// Each page's dcc.Store holds its matrices for the selected dataset as base64 typed
+// arrays. The functions below slice, sort and colour one row or column of them and
+// return the same figures as the plotting functions of the pages (plotly express
+// scatters), so changing a selection does not reach the server.
+
+const bundleArrays = new WeakMap();
+const bundleLabels = new WeakMap();
+const typedArrays = {float32: Float32Array, float64: Float64Array, int8: Int8Array, uint8: Uint8Array};
+
+// Values of a {dtype, shape, data} typed array, decoded once per bundle
+function decodeArray(typed) {
+    let values = bundleArrays.get(typed);
+    if (values === undefined) {
+        const text = atob(typed.data);
+        const bytes = new Uint8Array(text.length);
+        for (let i = 0; i < text.length; i++) {
+            bytes[i] = text.charCodeAt(i);
+        }
+        values = new typedArrays[typed.dtype](bytes.buffer);
+        bundleArrays.set(typed, values);
+    }
+    return values;
+}
+
+// Position of a label in a list of labels, or undefined
+function labelPosition(labels, label) {
+    let positions = bundleLabels.get(labels);
+    if (positions === undefined) {
+        positions = new Map(labels.map((item, position) => [item, position]));
+        bundleLabels.set(labels, positions);
+    }
+    return positions.get(label);
+}
+
+// Ascending order of the signed values, as Rankings.sorted_row/sorted_column (missing values
+// last, ties in file order)
+function signedOrder(values, sign) {
+    const order = Array.from(values.keys());
+    order.sort((a, b) => {
+        const missingA = Number.isNaN(values[a]);
+        const missingB = Number.isNaN(values[b]);
+        if (missingA || missingB) {
+            return missingA === missingB ? a - b : (missingA ? 1 : -1);
+        }
+        return sign * (values[a] - values[b]) || a - b;
+    });
+    return order;
+}
+
+// Labels and signed values of a row (axis 0) or column (axis 1) of a ranking matrix, sorted ascending
+function sortedLine(matrix, label, axis) {
+    const position = labelPosition(axis === 0 ? matrix.rows : matrix.columns, label);
+    if (position === undefined) {
+        return null;
+    }
+    const stored = decodeArray(matrix.values);
+    const [rows, columns] = matrix.values.shape;
+    const line = axis === 0 ? stored.subarray(position * columns, (position + 1) * columns)
+                            : Float32Array.from({length: rows}, (_, row) => stored[row * columns + position]);
+    const labels = axis === 0 ? matrix.columns : matrix.rows;
+    const order = signedOrder(line, matrix.sign);
+    // float32 values, shown to the precision they carry
+    return {labels: order.map((i) => labels[i]), values: order.map((i) => Number((matrix.sign * line[i]).toPrecision(7)))};
+}
+
+function ranks(length) {
+    return Array.from({length: length}, (_, i) => i + 1);
+}
+
+// Scatter figure as plotly express draws it: one trace, or with colour one trace per
+// category (in the given order, else in order of appearance) coloured in that order
+function scatterFigure(bundle, points, labels, title, colour) {
+    const hovertemplate = (prefix) => `<b>%{hovertext}</b><br><br>${prefix}${labels.x}=%{x}<br>${labels.y}=%{y}<extra></extra>`;
+    const trace = (name, x, y, hovertext, colourValue, showlegend, prefix) => ({
+        hovertemplate: hovertemplate(prefix), legendgroup: name, marker: {color: colourValue, symbol: "circle"},
+        mode: "markers", name: name, orientation: "v", showlegend: showlegend,
+        x: x, xaxis: "x", y: y, yaxis: "y", hovertext: hovertext, type: "scatter"
+    });
+    const layout = {
+        template: bundle.template,
+        xaxis: {anchor: "y", domain: [0, 1], title: {text: labels.x}},
+        yaxis: {anchor: "x", domain: [0, 1], title: {text: labels.y}},
+        legend: {tracegroupgap: 0},
+        title: {text: title}
+    };
+    if (!colour) {
+        const colorway = bundle.template.layout.colorway;
+        return {data: [trace("", points.x, points.y, points.hovertext, colorway[0], false, "")], layout: layout};
+    }
+
+    const groups = new Map();
+    colour.values.forEach((value, i) => {
+        if (!groups.has(value)) {
+            groups.set(value, []);
+        }
+        groups.get(value).push(i);
+    });
+    const categories = colour.order ? colour.order.filter((category) => groups.has(category)) : Array.from(groups.keys());
+    const data = categories.map((category, position) => {
+        const selected = groups.get(category);
+        return trace(category, selected.map((i) => points.x[i]), selected.map((i) => points.y[i]),
+                     selected.map((i) => points.hovertext[i]), colour.colours[position % colour.colours.length], true,
+                     `${colour.name}=${category}<br>`);
+    });
+    layout.legend = {title: {text: colour.name}, tracegroupgap: 0};
+    return {data: data, layout: layout};
+}
+
+// Ranking of one row or column, optionally coloured by the sign of the values
+function rankingFigure(bundle, matrix, label, axis, labels, title, coloured) {
+    const ranking = bundle ? sortedLine(bundle[matrix], label, axis) : null;
+    if (ranking === null) {
+        return window.dash_clientside.no_update;
+    }
+    const points = {x: ranks(ranking.values.length), y: ranking.values, hovertext: ranking.labels};
+    const colour = coloured ? {name: "Association", values: ranking.values.map((value) => (value >= 0 ? "Resistance" : "Sensitivity")),
+                               colours: ["blue", "red"]} : null;
+    return scatterFigure(bundle, points, labels, title, colour);
+}
+
+const volcanoEffects = ["Neutral", "Highly Decreased", "Highly Increased"];
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    rankings: {
+        // Dataset whose bundle a page needs when a selection changes before it is loaded
+        // (arguments: the selections, then the dataset of the loaded bundle and the selected dataset)
+        requestBundle: function(...selections) {
+            const [bundleDataset, dataset] = selections.slice(-2);
+            return bundleDataset === dataset ? window.dash_clientside.no_update : dataset;
+        },
+
+        // Page 1: genes ranked by their T-statistic for a metabolite
+        mutationRanking: function(metabolite, bundle) {
+            if (!bundle) {
+                return window.dash_clientside.no_update;
+            }
+            const position = labelPosition(bundle.tstats.rows, metabolite);
+            const name = position === undefined ? "" : bundle.metabolite_names[position];
+            return rankingFigure(bundle, "tstats", metabolite, 0, {x: "Mutation Rank", y: "T-Statistic"},
+                                 "Mutation rankings for " + name, false);
+        },
+
+        // Page 1: volcano plot of the metabolites for a gene
+        volcano: function(gene, bundle) {
+            const genePosition = bundle ? labelPosition(bundle.volcano.genes, gene) : undefined;
+            const column = bundle ? labelPosition(bundle.tstats.columns, gene) : undefined;
+            if (genePosition === undefined || column === undefined) {
+                return window.dash_clientside.no_update;
+            }
+            const tstats = decodeArray(bundle.tstats.values);
+            const columns = bundle.tstats.values.shape[1];
+            const diffexpr = decodeArray(bundle.volcano.diffexpr);
+            const ions = bundle.volcano.rows.length;
+            const points = {x: [], y: [], hovertext: bundle.volcano.metabolite};
+            const effects = [];
+            for (let i = 0; i < ions; i++) {
+                const tstat = Math.abs(tstats[bundle.volcano.rows[i] * columns + column]);
+                const diff = diffexpr[genePosition * ions + i];
+                points.y.push(Math.round(tstat * 1e4) / 1e4);
+                points.x.push(Math.round(diff * 1e6) / 1e6);
+                effects.push(tstat >= 5 && diff < 0 ? volcanoEffects[1] : (tstat >= 5 && diff > 0 ? volcanoEffects[2] : volcanoEffects[0]));
+            }
+            return scatterFigure(bundle, points, {x: "Metabolite log(10) Difference", y: "T-Statistic"},
+                                 "Volcano plot for metabolite changes associated with " + gene,
+                                 {name: "Effect", values: effects, order: volcanoEffects, colours: ["grey", "blue", "red"]});
+        },
+
+        // Page 2: TFs ranked for a pathway, and pathways ranked for a TF
+        tfRanking: function(pathway, bundle) {
+            return rankingFigure(bundle, "tf_rankings", pathway, 0, {x: "TF Rank", y: "-log10(Pvalue)"},
+                                 "Ranks of TFs against " + pathway + " activity", false);
+        },
+        pathwayRankingByTF: function(tf, bundle) {
+            return rankingFigure(bundle, "tf_rankings", tf, 1, {x: "Pathway Rank", y: "-log10(Pvalue)"},
+                                 "Ranks of pathways against " + tf + " activity", false);
+        },
+
+        // Page 3: drugs ranked for a pathway, and pathways ranked for a drug
+        drugRanking: function(pathway, bundle) {
+            return rankingFigure(bundle, "drug_sensitivity", pathway, 0, {x: "Drug Rank", y: "log10(Pvalue) * correlation direction"},
+                                 "Association of " + pathway + " activity with drug resistance/sensitivity", true);
+        },
+        pathwayRankingByDrug: function(drug, bundle) {
+            return rankingFigure(bundle, "drug_sensitivity", drug, 1, {x: "Pathway Rank", y: "log10(Pvalue) * correlation direction"},
+                                 "Association of resistance to " + drug + " with SMPDB pathway activity levels", true);
+        }
+    }
+});
@@ -0,0 +1,194 @@
+# Benchmark of every dashboard callback function on synthetic data
+#
+#     python -m benchmarks.bench_callbacks --ions 50000 --genes 20000 --output results.json
+#
+# Generates synthetic inputs (or reuses --data-dir), optionally builds the binary data
+# store, then calls each page function once cold (including loading its data) and
+# --repeats times warm. For each it records wall times, the process peak RSS and the
+# size of the JSON payload Dash would send to the browser. Results are written as JSON.
+# Afterwards it checks that zooming the heatmap shows the rows and columns zoomed into.
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import synthetic
+
+
+## Process peak resident set size in bytes (ru_maxrss is KB on Linux, bytes on macOS)
+def peak_rss():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output = True, text = True,
+                              cwd = os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return None
+
+
+## (name, function, arguments) for every callback, using values present in the synthetic data
+def callbacks(page1, page2, page3, page4, dataset):
+    metabolite = 1
+    return [
+        ("page1.plot_heatmap_tstats", page1.plot_heatmap_tstats, (dataset,)),
+        ("page1.metabolite_table_page", page1.metabolite_table_page, (0, page1.TABLE_PAGE_SIZE, [], "", dataset)),
+        ("page1.metabolite_options", page1.metabolite_options, ("metabolite 1", dataset, metabolite)),
+        ("page1.gene_options", page1.gene_options, ("gene1", dataset, synthetic.DEFAULT_GENE)),
+        ("page1.mutation_ranking_per_metabolite_plot", page1.mutation_ranking_per_metabolite_plot, (metabolite, dataset)),
+        ("page1.volcano_plot_per_mutation", page1.volcano_plot_per_mutation, (synthetic.DEFAULT_GENE, dataset)),
+        ("page1.swarmplot_per_metabolite_permutation", page1.swarmplot_per_metabolite_permutation,
+         (metabolite, synthetic.DEFAULT_GENE, dataset)),
+        ("page1.clientside_bundle", page1.clientside_bundle, (dataset,)),
+        ("page2.heatmap_TFS_plot", page2.heatmap_TFS_plot, (dataset,)),
+        ("page2.set_dropdown_options_1", page2.set_dropdown_options_1, (dataset,)),
+        ("page2.set_dropdown_options_2", page2.set_dropdown_options_2, (dataset,)),
+        ("page2.TF_ranking_by_pathway_id_plot", page2.TF_ranking_by_pathway_id_plot, (synthetic.DEFAULT_PATHWAY, dataset)),
+        ("page2.pathway_ranking_by_TF_id_plot", page2.pathway_ranking_by_TF_id_plot, (synthetic.DEFAULT_TF, dataset)),
+        ("page2.clientside_bundle", page2.clientside_bundle, (dataset,)),
+        ("page3.set_dropdown_options_page3_1", page3.set_dropdown_options_page3_1, (dataset,)),
+        ("page3.set_dropdown_options_page3_2", page3.set_dropdown_options_page3_2, (dataset,)),
+        ("page3.drug_sensitivity_by_pathway_plot", page3.drug_sensitivity_by_pathway_plot, (synthetic.DEFAULT_PATHWAY, dataset)),
+        ("page3.pathway_ranking_by_drug_plot", page3.pathway_ranking_by_drug_plot, (synthetic.DEFAULT_DRUG, dataset)),
+        ("page3.clientside_bundle", page3.clientside_bundle, (dataset,)),
+        ("page4.query_associations top-k", page4.query_associations, ("mutations", [dataset], 100, None, None, ["absolute"], [], [])),
+        ("page4.query_associations threshold", page4.query_associations, ("drugs", [dataset], None, 3, None, ["absolute"], [], [])),
+        ("page4.query_associations gene", page4.query_associations,
+         ("mutations", [dataset], 100, None, None, ["absolute"], [], [synthetic.DEFAULT_GENE])),
+    ]
+
+
+## Zoom the heatmap into full-resolution rows and columns, then zoom again as plotly reports it (box
+## corners in axis coordinates), and check the figure shows those rows and columns. The ion ids look
+## numeric, so the axes must be categorical for plotly to report the ranges as positions, not ids.
+def check_heatmap_zoom(page1, tiles, dataset):
+    data = page1.registry.get("tstats", dataset)
+    region = {"row_start": 10, "row_stop": 40, "column_start": 5, "column_stop": 25}
+    figure, values, view = page1.plot_heatmap_tstats(dataset, region)
+    if view["factor"] != 1:
+        raise RuntimeError(f"Heatmap zoom check: expected full resolution, got factor {view['factor']}")
+    ## plotly reports ranges as positions only on categorical axes (image heatmaps are drawn at positions)
+    if values is None and (figure.layout.xaxis.type, figure.layout.yaxis.type) != ("category", "category"):
+        raise RuntimeError("Heatmap zoom check: numeric-looking labels make linear axes, zoom ranges would be ids")
+    relayout = {"xaxis.range[0]": 1.6, "xaxis.range[1]": 4.4, "yaxis.range[0]": 7.4, "yaxis.range[1]": 2.6}
+    figure, values, view = page1.plot_heatmap_tstats(dataset, tiles.zoom_region(relayout, view))
+    expected_rows = [str(label) for label in data.index[13:18]]
+    expected_columns = [str(label) for label in data.columns[7:10]]
+    ## Image heatmaps carry their labels in the hover lookup
+    shown = values if values is not None else {"y": figure.data[0].y, "x": figure.data[0].x}
+    shown_rows, shown_columns = [str(label) for label in shown["y"]], [str(label) for label in shown["x"]]
+    if shown_rows != expected_rows or shown_columns != expected_columns:
+        raise RuntimeError(f"Heatmap zoom check: expected rows {expected_rows} and columns {expected_columns}, "
+                           f"got {shown_rows} and {shown_columns}")
+
+
+def run(arguments):
+    data_dir = arguments.data_dir or tempfile.mkdtemp(prefix = "cellline_benchmark_")
+    if not os.path.isdir(data_dir) or not os.listdir(data_dir):
+        start = time.perf_counter()
+        synthetic.generate(data_dir, ions = arguments.ions, genes = arguments.genes, samples = arguments.samples,
+                           drugs = arguments.drugs, tfs = arguments.tfs, mutations = arguments.mutations)
+        print(f"Generated synthetic data in {data_dir} ({time.perf_counter() - start:.1f} s)", file = sys.stderr)
+
+    ## The data layer reads its locations from the environment at import
+    os.environ["dash_data_dir"] = data_dir
+    os.environ["dash_store_dir"] = os.path.join(data_dir, "store")
+    os.environ["dash_cache_path"] = ""
+
+    from plotly.io.json import to_json_plotly
+    from utils import datastore
+
+    build_seconds = None
+    if arguments.store:
+        start = time.perf_counter()
+        datastore.build()
+        build_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    from pages import page1, page2, page3, page4
+    import_seconds = time.perf_counter() - start
+
+    results = []
+    for name, function, function_arguments in callbacks(page1, page2, page3, page4, arguments.dataset):
+        rss_before = peak_rss()
+        start = time.perf_counter()
+        output = function(*function_arguments)
+        cold_seconds = time.perf_counter() - start
+
+        warm_seconds = []
+        for _ in range(arguments.repeats):
+            start = time.perf_counter()
+            function(*function_arguments)
+            warm_seconds.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        payload = to_json_plotly(output)
+        serialise_seconds = time.perf_counter() - start
+
+        warm_seconds.sort()
+        results.append({
+            "callback": name,
+            "cold_seconds": cold_seconds,
+            "warm_min_seconds": warm_seconds[0] if warm_seconds else None,
+            "warm_median_seconds": warm_seconds[len(warm_seconds) // 2] if warm_seconds else None,
+            "serialise_seconds": serialise_seconds,
+            "payload_bytes": len(payload),
+            "peak_rss_bytes": peak_rss(),
+            "peak_rss_growth_bytes": peak_rss() - rss_before,
+        })
+        print(f"{name:<48}{cold_seconds:>10.3f} s cold{results[-1]['warm_median_seconds'] or 0:>10.4f} s warm"
+              f"{len(payload) / 1e3:>12.1f} KB", file = sys.stderr)
+
+    ## After the timings, so the callbacks are still timed cold
+    from utils import tiles
+    check_heatmap_zoom(page1, tiles, arguments.dataset)
+
+    return {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scale": {"ions": arguments.ions, "genes": arguments.genes, "samples": arguments.samples,
+                  "tfs": arguments.tfs, "drugs": arguments.drugs, "mutations": arguments.mutations},
+        "dataset": arguments.dataset,
+        "store": arguments.store,
+        "store_build_seconds": build_seconds,
+        "import_seconds": import_seconds,
+        "repeats": arguments.repeats,
+        "results": results,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-dir", help = "directory with (or for) the synthetic CSVs; a temporary one by default")
+    parser.add_argument("--ions", type = int, default = 2000)
+    parser.add_argument("--genes", type = int, default = 700)
+    parser.add_argument("--samples", type = int, default = 180)
+    parser.add_argument("--tfs", type = int, default = 100)
+    parser.add_argument("--drugs", type = int, default = 260)
+    parser.add_argument("--mutations", type = int, default = 50000)
+    parser.add_argument("--dataset", default = "shorthouse", choices = synthetic.DATASETS)
+    parser.add_argument("--store", action = "store_true", help = "build and load from the binary data store")
+    parser.add_argument("--repeats", type = int, default = 5)
+    parser.add_argument("--output", help = "write the JSON results to this file instead of stdout")
+    arguments = parser.parse_args()
+
+    ## Keep stdout for the report (the store build and some callbacks print)
+    with contextlib.redirect_stdout(sys.stderr):
+        results = run(arguments)
+
+    report = json.dumps(results, indent = 2)
+    if arguments.output:
+        with open(arguments.output, "w") as output_file:
+            output_file.write(report + "\n")
+    else:
+        print(report)
@@ -0,0 +1,182 @@
+# Load test of the production server: request throughput against the number of workers
+#
+#     python -m benchmarks.bench_load --workers 1 2 4 --clients 16 --seconds 20 --output results.json
+#
+# Starts gunicorn (gunicorn.conf.py, wsgi:server) on synthetic data once per worker
+# count, with one thread per worker and the figure caches disabled so every request
+# renders its figure, then sends callback requests (swarmplots for different genes)
+# from --clients concurrent connections for --seconds. For each worker count it records
+# requests per second, latency percentiles and the workers' total proportional memory.
+
+import argparse
+import concurrent.futures
+import http.client
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import synthetic
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as listener:
+        listener.bind(("127.0.0.1", 0))
+        return listener.getsockname()[1]
+
+
+## The callback drawing the swarmplot, from the app's /_dash-dependencies
+def swarmplot_callback(port):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout = 60)
+    connection.request("GET", "/_dash-dependencies")
+    dependencies = json.loads(connection.getresponse().read())
+    return next(callback for callback in dependencies if "swarmplot_metabolite.figure" in callback["output"])
+
+
+## Body of a _dash-update-component request for the swarmplot of a metabolite against a gene
+def swarmplot_request(callback, metabolite, gene, dataset):
+    values = {"metabolite_id.value": metabolite, "mutation_id.value": gene, "dataset_type.value": dataset}
+    states = {"page1_bundle_dataset.data": dataset}
+    outputs = [dict(zip(("id", "property"), output.split("."))) for output in callback["output"].strip(".").split("...")]
+    return json.dumps({
+        "output": callback["output"],
+        "outputs": outputs,
+        "inputs": [dict(item, value = values.get(f"{item['id']}.{item['property']}")) for item in callback["inputs"]],
+        ## The browser already has the page's bundle for the dataset, so only the swarmplot is drawn
+        "state": [dict(item, value = states.get(f"{item['id']}.{item['property']}")) for item in callback["state"]],
+        "changedPropIds": ["mutation_id.value"],
+    })
+
+
+def wait_until_ready(port, process, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {process.returncode}")
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout = 5)
+            connection.request("GET", "/health")
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn did not start in time")
+
+
+## Proportional set size of the gunicorn workers (children of the master), from /proc:
+## pages shared copy-on-write with the master count once, split between the processes sharing them
+def workers_pss(master_pid):
+    total = 0
+    for pid in os.listdir("/proc"):
+        try:
+            with open(f"/proc/{pid}/stat") as stat_file:
+                if int(stat_file.read().rsplit(")", 1)[1].split()[1]) != master_pid:
+                    continue
+            with open(f"/proc/{pid}/smaps_rollup") as smaps_file:
+                total += next(int(line.split()[1]) * 1024 for line in smaps_file if line.startswith("Pss:"))
+        except (OSError, ValueError, IndexError, StopIteration):
+            continue
+    return total
+
+
+## Send requests from one connection until the deadline; returns the latencies
+def client(port, bodies, deadline):
+    latencies = []
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout = 60)
+    index = 0
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        connection.request("POST", "/_dash-update-component", body = bodies[index % len(bodies)],
+                           headers = {"Content-Type": "application/json"})
+        response = connection.getresponse()
+        response.read()
+        if response.status != 200:
+            raise RuntimeError(f"callback request failed with {response.status}")
+        latencies.append(time.perf_counter() - start)
+        index += 1
+    connection.close()
+    return latencies
+
+
+def measure(data_dir, workers, arguments):
+    port = free_port()
+    environment = dict(os.environ, dash_data_dir = data_dir, dash_store_dir = os.path.join(data_dir, "store"),
+                       dash_cache_path = "", dash_memory_cache_bytes = "0", dash_port = str(port),
+                       dash_workers = str(workers), dash_threads = "1")
+    process = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:server"],
+                               cwd = ROOT, env = environment, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+    try:
+        start = time.perf_counter()
+        wait_until_ready(port, process, arguments.timeout)
+        ready_seconds = time.perf_counter() - start
+
+        genes = [synthetic.DEFAULT_GENE] + [f"GENE{i}" for i in range(1, min(arguments.genes, 200))]
+        callback = swarmplot_callback(port)
+        bodies = [swarmplot_request(callback, 1, gene, "shorthouse") for gene in genes]
+        client(port, bodies, time.monotonic() + arguments.warmup)
+
+        deadline = time.monotonic() + arguments.seconds
+        with concurrent.futures.ThreadPoolExecutor(arguments.clients) as executor:
+            shards = [bodies[offset:] + bodies[:offset] for offset in range(0, arguments.clients * 7, 7)]
+            latencies = sorted(latency for result in executor.map(lambda shard: client(port, shard, deadline), shards)
+                               for latency in result)
+        pss = workers_pss(process.pid)
+    finally:
+        process.terminate()
+        process.wait()
+
+    return {
+        "workers": workers,
+        "ready_seconds": ready_seconds,
+        "requests": len(latencies),
+        "requests_per_second": len(latencies) / arguments.seconds,
+        "latency_median_seconds": latencies[len(latencies) // 2],
+        "latency_p95_seconds": latencies[int(len(latencies) * 0.95)],
+        "workers_pss_bytes": pss,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-dir", help = "directory of input CSVs (generated when missing or empty)")
+    parser.add_argument("--ions", type = int, default = 2000)
+    parser.add_argument("--genes", type = int, default = 700)
+    parser.add_argument("--workers", type = int, nargs = "+", default = [1, 2, 4])
+    parser.add_argument("--clients", type = int, default = 16)
+    parser.add_argument("--seconds", type = float, default = 20)
+    parser.add_argument("--warmup", type = float, default = 2)
+    parser.add_argument("--timeout", type = float, default = 300, help = "seconds to wait for the server to load")
+    parser.add_argument("--output", help = "write the JSON results to this file instead of stdout")
+    arguments = parser.parse_args()
+
+    data_dir = arguments.data_dir or tempfile.mkdtemp(prefix = "cellline_load_")
+    if not os.path.isdir(data_dir) or not os.listdir(data_dir):
+        synthetic.generate(data_dir, ions = arguments.ions, genes = arguments.genes)
+        print(f"Generated synthetic data in {data_dir}", file = sys.stderr)
+
+    runs = []
+    for workers in arguments.workers:
+        runs.append(measure(data_dir, workers, arguments))
+        print(f"{workers} workers: {runs[-1]['requests_per_second']:.1f} requests/s", file = sys.stderr)
+
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "clients": arguments.clients,
+        "seconds": arguments.seconds,
+        "runs": runs,
+        "speedup": {run["workers"]: run["requests_per_second"] / runs[0]["requests_per_second"] for run in runs},
+    }
+    report = json.dumps(results, indent = 2)
+    if arguments.output:
+        with open(arguments.output, "w") as output_file:
+            output_file.write(report + "\n")
+    else:
+        print(report)
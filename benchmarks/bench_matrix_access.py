@@ -0,0 +1,77 @@
+# Micro-benchmark: memory allocated per request by the matrix access paths
+#
+# Compares the per-request code the pages used to run (negating / transposing the whole
+# matrix, then sorting) with the Matrix/Rankings access layer, on a synthetic matrix.
+#     python -m benchmarks.bench_matrix_access --rows 2000 --columns 1000
+
+import argparse
+import json
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from utils.matrices import Matrix
+from utils.rankings import Rankings
+
+
+## Peak bytes allocated by a call, and its mean wall time over repeats
+def measure(function, repeats = 20):
+    function()
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return peak, (time.perf_counter() - start) / repeats
+
+
+def cases(rows, columns):
+    rng = np.random.default_rng(0)
+    dataframe = pd.DataFrame(rng.normal(size = (rows, columns)),
+                             index = [f"row{i}" for i in range(rows)], columns = [f"col{j}" for j in range(columns)])
+    positive = Rankings(dataframe)
+    negative = Rankings(dataframe, sign = -1)
+    row_label, column_label = dataframe.index[rows // 2], dataframe.columns[columns // 2]
+
+    return {
+        "negated row ranking": (lambda: (-dataframe).loc[row_label].sort_values(),
+                                lambda: negative.sorted_row(row_label)),
+        "negated column ranking": (lambda: (-dataframe.T).loc[column_label].sort_values(),
+                                   lambda: negative.sorted_column(column_label)),
+        "column ranking": (lambda: dataframe.T.loc[column_label].sort_values(),
+                           lambda: positive.sorted_column(column_label)),
+        "sorted column": (lambda: dataframe.sort_index()[column_label],
+                          lambda: positive.column(column_label).sort_index()),
+        "row": (lambda: dataframe.T[row_label],
+                lambda: Matrix(dataframe).row(row_label)),
+        "heatmap values": (lambda: dataframe.reset_index().drop("index", axis = 1),
+                           lambda: dataframe.to_numpy()),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type = int, default = 2000)
+    parser.add_argument("--columns", type = int, default = 1000)
+    parser.add_argument("--json", action = "store_true", help = "print results as JSON")
+    arguments = parser.parse_args()
+
+    results = []
+    for name, (before, after) in cases(arguments.rows, arguments.columns).items():
+        before_bytes, before_seconds = measure(before)
+        after_bytes, after_seconds = measure(after)
+        results.append({"case": name, "before_bytes": before_bytes, "after_bytes": after_bytes,
+                        "before_seconds": before_seconds, "after_seconds": after_seconds})
+
+    if arguments.json:
+        print(json.dumps({"rows": arguments.rows, "columns": arguments.columns, "results": results}, indent = 2))
+    else:
+        print(f"{arguments.rows} x {arguments.columns} matrix ({arguments.rows * arguments.columns * 8 / 1e6:.1f} MB)")
+        print(f"{'case':<24}{'before KB':>12}{'after KB':>12}{'before ms':>12}{'after ms':>12}")
+        for result in results:
+            print(f"{result['case']:<24}{result['before_bytes'] / 1e3:>12.1f}{result['after_bytes'] / 1e3:>12.1f}"
+                  f"{result['before_seconds'] * 1e3:>12.3f}{result['after_seconds'] * 1e3:>12.3f}")
@@ -0,0 +1,101 @@
+# Benchmark of the dashboard's startup cost: import time and memory of `import main`
+#
+#     python -m benchmarks.bench_startup --repeats 5 --compare 63cc727 --output results.json
+#
+# Each run imports main in a fresh interpreter (as a worker process does) and records
+# the wall time of the import, the process peak RSS afterwards, and the number of Dash
+# apps and registered callbacks. With --compare, the same is measured for another git
+# revision, extracted to a temporary directory that shares this tree's ./Data.
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+## Run in the measured tree: import main, then report what it cost
+PROBE = """
+import gc, json, resource, sys, time
+start = time.perf_counter()
+import main
+seconds = time.perf_counter() - start
+import dash
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+apps = [item for item in gc.get_objects() if isinstance(item, dash.Dash)]
+print(json.dumps({"import_seconds": seconds,
+                  "peak_rss_bytes": peak if sys.platform == "darwin" else peak * 1024,
+                  "dash_apps": len(apps),
+                  "callbacks": sum(len(app.callback_map) for app in apps),
+                  "modules": len(sys.modules)}))
+"""
+
+
+def measure(tree, repeats):
+    runs = []
+    for _ in range(repeats):
+        completed = subprocess.run([sys.executable, "-c", PROBE], cwd = tree, capture_output = True, text = True,
+                                   env = dict(os.environ, dash_cache_path = ""))
+        if completed.returncode != 0:
+            raise RuntimeError(f"import main failed in {tree}:\n{completed.stderr}")
+        runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    seconds = sorted(run["import_seconds"] for run in runs)
+    rss = sorted(run["peak_rss_bytes"] for run in runs)
+    return {
+        "import_min_seconds": seconds[0],
+        "import_median_seconds": seconds[len(seconds) // 2],
+        "peak_rss_median_bytes": rss[len(rss) // 2],
+        "dash_apps": runs[0]["dash_apps"],
+        "callbacks": runs[0]["callbacks"],
+        "modules": runs[0]["modules"],
+    }
+
+
+## Extract a revision of this repository next to the current data
+def checkout(revision):
+    directory = tempfile.mkdtemp(prefix = "cellline_startup_")
+    archive = subprocess.run(["git", "archive", revision], cwd = ROOT, capture_output = True, check = True).stdout
+    subprocess.run(["tar", "-x", "-C", directory], input = archive, check = True)
+    data_dir = os.path.join(directory, "Data")
+    shutil.rmtree(data_dir, ignore_errors = True)
+    os.symlink(os.path.join(ROOT, "Data"), data_dir)
+    return directory
+
+
+def revision_of(tree):
+    return subprocess.run(["git", "rev-parse", "HEAD"], capture_output = True, text = True, cwd = tree).stdout.strip() or None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type = int, default = 5)
+    parser.add_argument("--compare", help = "git revision to measure as well, e.g. the commit before a change")
+    parser.add_argument("--output", help = "write the JSON results to this file instead of stdout")
+    arguments = parser.parse_args()
+
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeats": arguments.repeats,
+        "current": dict(revision = revision_of(ROOT), **measure(ROOT, arguments.repeats)),
+    }
+    if arguments.compare:
+        tree = checkout(arguments.compare)
+        try:
+            results["compare"] = dict(revision = arguments.compare, **measure(tree, arguments.repeats))
+        finally:
+            shutil.rmtree(tree, ignore_errors = True)
+        for key in ("import_median_seconds", "peak_rss_median_bytes"):
+            results[f"{key}_saved"] = results["compare"][key] - results["current"][key]
+
+    report = json.dumps(results, indent = 2)
+    if arguments.output:
+        with open(arguments.output, "w") as output_file:
+            output_file.write(report + "\n")
+    else:
+        print(report)
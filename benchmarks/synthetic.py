@@ -0,0 +1,106 @@
+# Synthetic input tables with the same schema as the CSVs in ./Data, at a chosen scale
+#
+#     python -m benchmarks.synthetic /tmp/synthetic_data --ions 50000 --genes 20000
+#
+# Matrices are written in row chunks, so the generator itself never holds a full
+# ions x genes matrix in memory.
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+DATASETS = ["shorthouse", "cherkaoui"]
+
+## Values used as the dashboard defaults, always present in the synthetic data
+DEFAULT_GENE = "A1CF"
+DEFAULT_PATHWAY = "Citric Acid Cycle"
+DEFAULT_TF = "AR"
+DEFAULT_DRUG = "Cisplatin"
+
+
+def write_matrix(path, index_name, index, columns, generate, chunk_rows = 2000):
+    with open(path, "w") as csv_file:
+        csv_file.write(",".join([index_name] + list(columns)) + "\n")
+        for start in range(0, len(index), chunk_rows):
+            chunk_index = index[start:start + chunk_rows]
+            chunk = pd.DataFrame(generate(len(chunk_index), len(columns)), index = chunk_index)
+            chunk.to_csv(csv_file, header = False)
+
+
+def generate(data_dir, ions = 2000, genes = 700, samples = 180, pathways = 97, tfs = 100, drugs = 260,
+             mutations = 50000, seed = 0):
+    rng = np.random.default_rng(seed)
+    os.makedirs(data_dir, exist_ok = True)
+
+    ion_ids = np.arange(1, ions + 1)
+    gene_names = [DEFAULT_GENE] + [f"GENE{i}" for i in range(1, genes)]
+    sample_ids = [str(i) for i in range(1, samples + 1)]
+    cellline_names = [f"CELLLINE-{i}" for i in range(samples)]
+    pathway_names = ["Alanine Metabolism", DEFAULT_PATHWAY] + [f"Pathway {i}" for i in range(2, pathways)]
+    tf_names = [DEFAULT_TF] + [f"TF{i}" for i in range(1, tfs)]
+    drug_names = [DEFAULT_DRUG] + [f"Drug-{i}" for i in range(1, drugs)]
+    progeny_names = ["Androgen", "EGFR", "Estrogen", "Hypoxia", "JAK-STAT", "MAPK", "NFkB", "p53", "PI3K", "TGFb",
+                     "TNFa", "Trail", "VEGF", "WNT"]
+
+    for dataset in DATASETS:
+        ## Metabolite reference table, one to three annotations per ion
+        annotations = rng.integers(1, 4, size = ions)
+        reference_ions = np.repeat(ion_ids, annotations)
+        pd.DataFrame({
+            "ionIdx": reference_ions,
+            "ionMz": np.repeat(rng.uniform(50, 1000, ions), annotations),
+            "average intensity": np.repeat(rng.uniform(10, 1e5, ions), annotations),
+            "mz difference": rng.normal(0, 1e-3, len(reference_ions)),
+            "id": [f"HMDB{i:05d}" for i in rng.integers(0, 99999, len(reference_ions))],
+            "score": rng.integers(50, 101, len(reference_ions)),
+            "formula": "C6H12O6",
+            "ion": "-H(+)",
+            "name": [f"Metabolite {i}" for i in range(len(reference_ions))],
+        }).to_csv(os.path.join(data_dir, f"Metabolite_reference_table_{dataset}.csv"), index = False)
+
+        ## T-statistics (ions in "ordered" file order) and differential expression, ions x genes
+        write_matrix(os.path.join(data_dir, f"Mutation_metabolite_associations_ordered_{dataset}.csv"), "",
+                     rng.permutation(ion_ids), gene_names, lambda n, m: rng.normal(0, 4, (n, m)))
+        write_matrix(os.path.join(data_dir, f"Mutation_differential_expression_{dataset}.csv"), "ionIdx",
+                     ion_ids, gene_names, lambda n, m: rng.normal(0, 0.5, (n, m)))
+
+        ## Metabolite levels, ions x samples (plus ionMz, dropped when loading)
+        write_matrix(os.path.join(data_dir, f"Metabolite_levels_{dataset}.csv"), "ionIdx", ion_ids,
+                     ["ionMz"] + sample_ids, lambda n, m: rng.uniform(10, 1e5, (n, m)))
+
+        pd.DataFrame({"dsIdx": np.arange(1, samples + 1), "ID": cellline_names}).to_csv(
+            os.path.join(data_dir, f"Cellline_mappings_{dataset}.csv"), index = False)
+
+        ## Pathway tables
+        write_matrix(os.path.join(data_dir, f"Progeny_correlations_{dataset}.csv"), "Pathway", pathway_names,
+                     [f"Score_{name}" for name in progeny_names], lambda n, m: rng.normal(-1, 1, (n, m)))
+        write_matrix(os.path.join(data_dir, f"TF_pathway_correlations_{dataset}.csv"), "Pathway", pathway_names,
+                     [f"Score_{name}" for name in tf_names], lambda n, m: rng.normal(-1, 1, (n, m)))
+        write_matrix(os.path.join(data_dir, f"Pathway_direction_pvalue_{dataset}.csv"), "Pathway", pathway_names,
+                     drug_names, lambda n, m: rng.normal(0, 1, (n, m)))
+
+    ## Mutations in celllines, shared by both datasets
+    pd.DataFrame({
+        "HGNC": np.array(gene_names)[rng.integers(0, genes, mutations)],
+        "MutationType": rng.choice(["Missense", "Nonsense", "Frameshift", "Silent"], mutations),
+        "CellLineName_Cellosaurus": np.array(cellline_names)[rng.integers(0, samples, mutations)],
+        "AA_Mutation": [f"p.A{position}V" for position in rng.integers(1, 1000, mutations)],
+    }).to_csv(os.path.join(data_dir, "Mutations_in_celllines.csv"), index = False)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("data_dir")
+    parser.add_argument("--ions", type = int, default = 2000)
+    parser.add_argument("--genes", type = int, default = 700)
+    parser.add_argument("--samples", type = int, default = 180)
+    parser.add_argument("--pathways", type = int, default = 97)
+    parser.add_argument("--tfs", type = int, default = 100)
+    parser.add_argument("--drugs", type = int, default = 260)
+    parser.add_argument("--mutations", type = int, default = 50000)
+    parser.add_argument("--seed", type = int, default = 0)
+    arguments = parser.parse_args()
+    generate(arguments.data_dir, arguments.ions, arguments.genes, arguments.samples, arguments.pathways,
+             arguments.tfs, arguments.drugs, arguments.mutations, arguments.seed)
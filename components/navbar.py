@@ -11,6 +11,7 @@ def Navbar():
                 dbc.NavItem(dbc.NavLink("Mutations", href="/page1")),
                 dbc.NavItem(dbc.NavLink("Transcription Factors", href="/page2")),
                 dbc.NavItem(dbc.NavLink("Drug Sensitivity", href="/page3")),
+                dbc.NavItem(dbc.NavLink("Associations", href="/page4")),
             ] ,
             brand="Heterogeneity of the Cancer Cell Line Metabolic Landscape",
             brand_href="/page1",
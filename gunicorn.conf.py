@@ -0,0 +1,16 @@
+# gunicorn settings for the production server (see wsgi.py)
+#
+# Worker processes and threads per worker can be overridden from the environment,
+# as in Dockerfile.prod.
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('dash_port', '80')}"
+workers = int(os.environ.get("dash_workers", multiprocessing.cpu_count()))
+threads = int(os.environ.get("dash_threads", "4"))
+worker_class = "gthread"
+timeout = int(os.environ.get("dash_timeout", "120"))
+
+## Import the app (and load the data) once in the master, then fork the workers
+preload_app = True
@@ -1,16 +1,23 @@
 # Import necessary libraries
-from dash import html, dcc
-from dash.dependencies import Input, Output
+import os
+
+from dash import html, dcc, callback_context, no_update
+from dash.dependencies import Input, Output, State, ClientsideFunction
+from dash.exceptions import PreventUpdate
 
 # Connect to main app.py file
 from app import app
 
 # Connect to your app pages
-from pages import page1, page2, page3
+from pages import page1, page2, page3, page4
 
 # Connect the navbar to the index
 from components import navbar
 
+# Cache and instrumentation for callback outputs
+from utils.figure_cache import figure_cache
+from utils import api, heatmaps, metrics, tiles
+
 # Define the navbar
 nav = navbar.Navbar()
 
@@ -25,167 +32,293 @@ app.layout = html.Div([
 ])
 
 ## Callbacks for page 1
+## The outputs for the default selections are embedded in the page layouts (utils/artifacts.py).
+## Each page has one server callback for everything that depends on the dataset: a dataset change
+## updates all of its outputs in a single request, and any other input only updates the outputs
+## it affects (callback_context.triggered_prop_ids). The plots drawn in the browser get their bundle
+## with the first change of their selections (the defaults are embedded) or of the dataset, so
+## opening a page makes no callback request and does not download the bundle.
+
+## Outputs of update_page1, in order
+PAGE1_OUTPUTS = ["heatmap", "heatmap_values", "heatmap_view", "table_data", "table_page_count",
+                 "metabolite_options", "gene_options", "bundle", "bundle_dataset", "swarmplot"]
+TABLE_INPUTS = {"table1.page_current", "table1.page_size", "table1.sort_by", "table1.filter_query"}
 
-## Callback for tstat heatmap
 @app.callback(
-    Output(component_id = 'heatmap_top1', component_property = 'figure'),
-    Input(component_id = 'dataset_type', component_property = 'value')
+    [Output(component_id = 'heatmap_top1', component_property = 'figure'),
+     Output(component_id = 'heatmap_top1_values', component_property = 'data'),
+     Output(component_id = 'heatmap_top1_view', component_property = 'data'),
+     Output(component_id = "table1", component_property = "data"),
+     Output(component_id = "table1", component_property = "page_count"),
+     Output(component_id = "metabolite_id", component_property = "options"),
+     Output(component_id = "mutation_id", component_property = "options"),
+     Output(component_id = "page1_bundle", component_property = "data"),
+     Output(component_id = "page1_bundle_dataset", component_property = "data"),
+     Output(component_id = "swarmplot_metabolite", component_property = "figure")],
+    [Input(component_id = 'dataset_type', component_property = 'value'),
+     Input(component_id = 'heatmap_top1_ordering', component_property = 'value'),
+     Input(component_id = 'heatmap_top1', component_property = 'relayoutData'),
+     Input(component_id = "table1", component_property = "page_current"),
+     Input(component_id = "table1", component_property = "page_size"),
+     Input(component_id = "table1", component_property = "sort_by"),
+     Input(component_id = "table1", component_property = "filter_query"),
+     Input(component_id = "metabolite_id", component_property = "search_value"),
+     Input(component_id = "mutation_id", component_property = "search_value"),
+     Input(component_id = "metabolite_id", component_property = "value"),
+     Input(component_id = "mutation_id", component_property = "value")],
+    [State(component_id = 'heatmap_top1_view', component_property = 'data'),
+     State(component_id = 'page1_bundle_dataset', component_property = 'data')],
+    prevent_initial_call = True
 )
-def plot_heatmap_tstats(dataset):
-    graph = page1.plot_heatmap_tstats(dataset)
+def update_page1(dataset, ordering, relayout, page_current, page_size, sort_by, filter_query,
+                 metabolite_search, gene_search, metabolite, gene, view, bundle_dataset):
+    triggered = set(callback_context.triggered_prop_ids)
+    dataset_changed = "dataset_type.value" in triggered
+    outputs = dict.fromkeys(PAGE1_OUTPUTS, no_update)
+
+    if dataset_changed or (triggered & {"metabolite_id.value", "mutation_id.value"} and bundle_dataset != dataset):
+        outputs["bundle"], outputs["bundle_dataset"] = bundle_page1(dataset), dataset
+
+    ## Heatmap: the whole matrix on a dataset or ordering change, the visible region on zoom
+    if dataset_changed or "heatmap_top1_ordering.value" in triggered:
+        outputs["heatmap"], outputs["heatmap_values"], outputs["heatmap_view"] = heatmap_tstats(dataset, None, ordering)
+    elif ("heatmap_top1.relayoutData" in triggered and view is not None and view.get("dataset") == dataset
+          and view.get("ordering") == ordering):
+        region = tiles.zoom_region(relayout, view)
+        if region != view:
+            outputs["heatmap"], outputs["heatmap_values"], outputs["heatmap_view"] = heatmap_tstats(dataset, region, ordering)
+
+    ## Page of table1 (paged, filtered and sorted on the server)
+    if dataset_changed or triggered & TABLE_INPUTS:
+        outputs["table_data"], outputs["table_page_count"] = page1.metabolite_table_page(
+            page_current, page_size, sort_by, filter_query, dataset)
+
+    ## Dropdown options matching the typed search (plus the selected value)
+    if dataset_changed or "metabolite_id.search_value" in triggered:
+        outputs["metabolite_options"] = page1.metabolite_options(metabolite_search, dataset, metabolite)
+    if dataset_changed or "mutation_id.search_value" in triggered:
+        outputs["gene_options"] = page1.gene_options(gene_search, dataset, gene)
+
+    ## Swarmplot of the selected metabolite and gene (unchanged while either is missing from the dataset)
+    if triggered & {"dataset_type.value", "metabolite_id.value", "mutation_id.value"} and metabolite is not None and gene:
+        try:
+            outputs["swarmplot"] = swarmplot(metabolite, gene, dataset)
+        except KeyError:
+            pass
+
+    if all(value is no_update for value in outputs.values()):
+        raise PreventUpdate
+    return [outputs[name] for name in PAGE1_OUTPUTS]
+
+@figure_cache.memoize("heatmap_tstats_" + heatmaps.PAYLOAD)
+def heatmap_tstats(dataset, region, ordering):
+    graph = page1.plot_heatmap_tstats(dataset, region, ordering)
     return graph
 
-## Callback for table1
-@app.callback(
-    Output(component_id = "metabolite_table", component_property = "data"),
-    [Input(component_id = "dataset_type", component_property = "value")]
-)
-def generate_table(dataset):
-    tabledata = page1.generate_tabledata(dataset)
-    return tabledata
-
-## Callback for updating table 1
-@app.callback(Output('table1', 'data'),
-              Input('metabolite_table', 'data'))
-def update_table(dataset):
-    tableupdate = page1.on_data_set_table(dataset)
-    return tableupdate
-
-## Callback for updating dropdowns
-@app.callback(
-    Output(component_id = "metabolite_id", component_property = "options"),
-    [Input(component_id = "dataset_type", component_property = "value")]
+@figure_cache.memoize("page1_bundle")
+def bundle_page1(dataset):
+    return page1.clientside_bundle(dataset)
+
+@figure_cache.memoize("swarmplot_metabolite")
+def swarmplot(metabolite_id_value, mutation_gene, dataset):
+    graph = page1.swarmplot_per_metabolite_permutation(metabolite_id_value, mutation_gene, dataset)
+    return graph
+
+## Hover text for the heatmap in image mode
+app.clientside_callback(
+    ClientsideFunction(namespace = 'heatmap', function_name = 'hover'),
+    Output(component_id = 'heatmap_top1_hover', component_property = 'children'),
+    Input(component_id = 'heatmap_top1', component_property = 'hoverData'),
+    State(component_id = 'heatmap_top1_values', component_property = 'data')
 )
-def update_dropdown_page1_1(dataset):
-    dropdown_values = page1.dropdown_update(dataset)
-    return dropdown_values
 
-## Callback for mutation rankings per metabolite
-@app.callback(
+## Mutation rankings per metabolite and volcano plot per mutation, drawn in the browser (assets/rankings.js)
+app.clientside_callback(
+    ClientsideFunction(namespace = 'rankings', function_name = 'mutationRanking'),
     Output(component_id = "mutation_ranking_per_metabolite", component_property = "figure"),
     [Input(component_id = "metabolite_id", component_property = "value"),
-    Input(component_id = "dataset_type", component_property = "value")]
+    Input(component_id = "page1_bundle", component_property = "data")],
+    prevent_initial_call = True
 )
-def update_graph1(metabolite_id_value, dataset):
-    graph = page1.mutation_ranking_per_metabolite_plot(metabolite_id_value, dataset)
-    return graph
 
-## Callback for volcano plot of metabolites against mutations
-@app.callback(
+app.clientside_callback(
+    ClientsideFunction(namespace = 'rankings', function_name = 'volcano'),
     Output(component_id = "mutation_volcano_plot", component_property = "figure"),
     [Input(component_id = "mutation_id", component_property = "value"),
-    Input(component_id = "dataset_type", component_property = "value")]
+    Input(component_id = "page1_bundle", component_property = "data")],
+    prevent_initial_call = True
 )
-def update_graph2(mutation_name, dataset):
-    graph = page1.volcano_plot_per_mutation(mutation_name, dataset)
-    return graph
-
-## Callback for mutation swarmplot
-@app.callback(
-    Output(component_id = "swarmplot_metabolite", component_property = "figure"),
-    [Input(component_id = "metabolite_id", component_property = "value"),
-    Input(component_id = "mutation_id", component_property = "value"),
-    Input(component_id = "dataset_type", component_property = "value")]
-)
-
-def update_graph3(metabolite_id_value, mutation_gene, dataset):
-    graph = page1.swarmplot_per_metabolite_permutation(metabolite_id_value, mutation_gene, dataset)
-    return graph
 
 ## Callbacks for page 2
 
-## Callback for TF heatmap_big
+## TF heatmap, dropdown options and bundle for a dataset (only the heatmap on an ordering change,
+## only the bundle when requested by the first pathway or TF change)
 @app.callback(
-    Output(component_id = 'heatmap_top', component_property = 'figure'),
-    Input(component_id = 'dataset_type', component_property = 'value')
+    [Output(component_id = 'heatmap_top', component_property = 'figure'),
+     Output(component_id = 'heatmap_top_values', component_property = 'data'),
+     Output(component_id = "pathway", component_property = "options"),
+     Output(component_id = "TF", component_property = "options"),
+     Output(component_id = "page2_bundle", component_property = "data"),
+     Output(component_id = "page2_bundle_dataset", component_property = "data")],
+    [Input(component_id = 'dataset_type', component_property = 'value'),
+     Input(component_id = 'heatmap_top_ordering', component_property = 'value'),
+     Input(component_id = "page2_bundle_request", component_property = "data")],
+    State(component_id = 'page2_bundle_dataset', component_property = 'data'),
+    prevent_initial_call = True
 )
-def update_graph_TFheatmap(dataset):
-    graph = page2.heatmap_TFS_plot(dataset)
+def update_page2(dataset, ordering, bundle_request, bundle_dataset):
+    triggered = set(callback_context.triggered_prop_ids)
+    if not triggered & {"dataset_type.value", "heatmap_top_ordering.value"}:
+        if bundle_dataset == dataset:
+            raise PreventUpdate
+        return no_update, no_update, no_update, no_update, bundle_page2(dataset), dataset
+    graph, values = heatmap_TFS(dataset, ordering)
+    if "dataset_type.value" not in triggered:
+        return graph, values, no_update, no_update, no_update, no_update
+    return (graph, values, page2.set_dropdown_options_1(dataset), page2.set_dropdown_options_2(dataset),
+            bundle_page2(dataset), dataset)
+
+@figure_cache.memoize("heatmap_TFS_" + heatmaps.PAYLOAD)
+def heatmap_TFS(dataset, ordering):
+    graph = page2.heatmap_TFS_plot(dataset, ordering)
     return graph
 
-## Callback for dropdown for pathways
-@app.callback(
-    Output(component_id = "pathway", component_property = "options"),
-    [Input(component_id = "dataset_type", component_property = "value")]
-)
-
-def update_dropdownpathways(dataset):
-    dropdownlist = page2.set_dropdown_options_1(dataset)
-    return dropdownlist
+@figure_cache.memoize("page2_bundle")
+def bundle_page2(dataset):
+    return page2.clientside_bundle(dataset)
 
-## Callback for dropdown for TFs
-@app.callback(
-    Output(component_id = "TF", component_property = "options"),
-    [Input(component_id = "dataset_type", component_property = "value")]
+## Request the bundle when a selection changes before it is loaded (assets/rankings.js), so
+## selection changes make no server request once it is
+app.clientside_callback(
+    ClientsideFunction(namespace = 'rankings', function_name = 'requestBundle'),
+    Output(component_id = "page2_bundle_request", component_property = "data"),
+    [Input(component_id = "pathway", component_property = "value"),
+     Input(component_id = "TF", component_property = "value")],
+    [State(component_id = "page2_bundle_dataset", component_property = "data"),
+     State(component_id = "dataset_type", component_property = "value")],
+    prevent_initial_call = True
 )
 
-def update_dropdownTFS(dataset):
-    dropdownlist = page2.set_dropdown_options_2(dataset)
-    return dropdownlist
+## Hover text for the heatmap in image mode
+app.clientside_callback(
+    ClientsideFunction(namespace = 'heatmap', function_name = 'hover'),
+    Output(component_id = 'heatmap_top_hover', component_property = 'children'),
+    Input(component_id = 'heatmap_top', component_property = 'hoverData'),
+    State(component_id = 'heatmap_top_values', component_property = 'data')
+)
 
-## Callback for mutation rankings per metabolite
-@app.callback(
+## TF rankings per pathway and pathway rankings per TF, drawn in the browser (assets/rankings.js)
+app.clientside_callback(
+    ClientsideFunction(namespace = 'rankings', function_name = 'tfRanking'),
     Output(component_id = "TF_ranking_per_pathway", component_property = "figure"),
     [Input(component_id = "pathway", component_property = "value"),
-    Input(component_id = "dataset_type", component_property = "value")]
+    Input(component_id = "page2_bundle", component_property = "data")],
+    prevent_initial_call = True
 )
-def update_graph4(pathway_name, dataset):
-    graph = page2.TF_ranking_by_pathway_id_plot(pathway_name, dataset)
-    return graph
 
-## Callback for TF ranking per pathway
-@app.callback(
+app.clientside_callback(
+    ClientsideFunction(namespace = 'rankings', function_name = 'pathwayRankingByTF'),
     Output(component_id = "pathway_ranking_per_TF", component_property = "figure"),
     [Input(component_id = "TF", component_property = "value"),
-    Input(component_id = "dataset_type", component_property = "value")]
+    Input(component_id = "page2_bundle", component_property = "data")],
+    prevent_initial_call = True
 )
 
-def update_graph5(TF_name, dataset):
-    graph = page2.pathway_ranking_by_TF_id_plot(TF_name, dataset)
-    return graph
-
 ## Callbacks for page 3
 
-## Callbacks for dropdowns
+## Dropdown options and bundle for a dataset (only the bundle when requested by the first pathway or drug change)
 @app.callback(
-    Output(component_id = "pathway2", component_property = "options"),
-    [Input(component_id = "dataset_type", component_property = "value")]
+    [Output(component_id = "pathway2", component_property = "options"),
+     Output(component_id = "drug", component_property = "options"),
+     Output(component_id = "page3_bundle", component_property = "data"),
+     Output(component_id = "page3_bundle_dataset", component_property = "data")],
+    [Input(component_id = "dataset_type", component_property = "value"),
+     Input(component_id = "page3_bundle_request", component_property = "data")],
+    State(component_id = 'page3_bundle_dataset', component_property = 'data'),
+    prevent_initial_call = True
 )
-
-def update_dropdown_page3_1(dataset):
-    dropdownlist = page3.set_dropdown_options_page3_1(dataset)
-    return dropdownlist
-
-@app.callback(
-    Output(component_id = "drug", component_property = "options"),
-    [Input(component_id = "dataset_type", component_property = "value")]
+def update_page3(dataset, bundle_request, bundle_dataset):
+    if "dataset_type.value" not in callback_context.triggered_prop_ids:
+        if bundle_dataset == dataset:
+            raise PreventUpdate
+        return no_update, no_update, bundle_page3(dataset), dataset
+    return (page3.set_dropdown_options_page3_1(dataset), page3.set_dropdown_options_page3_2(dataset),
+            bundle_page3(dataset), dataset)
+
+@figure_cache.memoize("page3_bundle")
+def bundle_page3(dataset):
+    return page3.clientside_bundle(dataset)
+
+## Request the bundle when a selection changes before it is loaded (assets/rankings.js)
+app.clientside_callback(
+    ClientsideFunction(namespace = 'rankings', function_name = 'requestBundle'),
+    Output(component_id = "page3_bundle_request", component_property = "data"),
+    [Input(component_id = "pathway2", component_property = "value"),
+     Input(component_id = "drug", component_property = "value")],
+    [State(component_id = "page3_bundle_dataset", component_property = "data"),
+     State(component_id = "dataset_type", component_property = "value")],
+    prevent_initial_call = True
 )
 
-def update_dropdown_page3_2(dataset):
-    dropdownlist = page3.set_dropdown_options_page3_2(dataset)
-    return dropdownlist
-
-## Callback for drug sensitivity per pathway
-@app.callback(
+## Drug sensitivity per pathway and pathway rankings per drug, drawn in the browser (assets/rankings.js)
+app.clientside_callback(
+    ClientsideFunction(namespace = 'rankings', function_name = 'drugRanking'),
     Output(component_id = "drug_sensitivity_by_pathway", component_property = "figure"),
     [Input(component_id = "pathway2", component_property = "value"),
-    Input(component_id = "dataset_type", component_property = "value")]
+    Input(component_id = "page3_bundle", component_property = "data")],
+    prevent_initial_call = True
 )
 
-def update_graph6(pathway_name, dataset):
-    graph = page3.drug_sensitivity_by_pathway_plot(pathway_name, dataset)
-    return graph
-
-## Callback for pathway rankings per drug_name
-@app.callback(
+app.clientside_callback(
+    ClientsideFunction(namespace = 'rankings', function_name = 'pathwayRankingByDrug'),
     Output(component_id = "pathway_ranking_by_drug", component_property = "figure"),
     [Input(component_id = "drug", component_property = "value"),
-    Input(component_id = "dataset_type", component_property = "value")]
+    Input(component_id = "page3_bundle", component_property = "data")],
+    prevent_initial_call = True
 )
 
-def update_graph7(drug_name, dataset):
-    graph = page3.pathway_ranking_by_drug_plot(drug_name, dataset)
-    return graph
+## Callbacks for page 4
+
+## Results table for a query, and the options of the row and column filters matching the typed
+## search. A matrix change clears the filters, which name rows and columns of the previous matrix.
+@app.callback(
+    [Output(component_id = "association_table", component_property = "data"),
+     Output(component_id = "association_table", component_property = "columns"),
+     Output(component_id = "association_summary", component_property = "children"),
+     Output(component_id = "association_rows", component_property = "options"),
+     Output(component_id = "association_columns", component_property = "options"),
+     Output(component_id = "association_rows", component_property = "value"),
+     Output(component_id = "association_columns", component_property = "value")],
+    [Input(component_id = "association_matrix", component_property = "value"),
+     Input(component_id = "association_datasets", component_property = "value"),
+     Input(component_id = "association_top_k", component_property = "value"),
+     Input(component_id = "association_minimum", component_property = "value"),
+     Input(component_id = "association_maximum", component_property = "value"),
+     Input(component_id = "association_absolute", component_property = "value"),
+     Input(component_id = "association_rows", component_property = "value"),
+     Input(component_id = "association_columns", component_property = "value"),
+     Input(component_id = "association_rows", component_property = "search_value"),
+     Input(component_id = "association_columns", component_property = "search_value")],
+    prevent_initial_call = True
+)
+def update_page4(matrix, datasets, top_k, minimum, maximum, absolute, rows, columns, rows_search, columns_search):
+    triggered = set(callback_context.triggered_prop_ids)
+    matrix_changed = "association_matrix.value" in triggered
+    if matrix_changed:
+        rows, columns = [], []
+    outputs = [no_update] * 7
+
+    if triggered - {"association_rows.search_value", "association_columns.search_value"}:
+        outputs[0:3] = page4.query_associations(matrix, datasets, top_k, minimum, maximum, absolute, rows, columns)
+    if matrix_changed or triggered & {"association_datasets.value", "association_rows.search_value"}:
+        outputs[3] = page4.association_options(matrix, "rows", datasets, rows_search, rows)
+    if matrix_changed or triggered & {"association_datasets.value", "association_columns.search_value"}:
+        outputs[4] = page4.association_options(matrix, "columns", datasets, columns_search, columns)
+    if matrix_changed:
+        outputs[5:7] = rows, columns
+    return outputs
+
+
 
 
 
@@ -194,21 +327,31 @@ def update_graph7(drug_name, dataset):
               [Input('url', 'pathname')])
 def display_page(pathname):
     if pathname == '/page1':
-        return page1.layout
+        return page1.layout()
     if pathname == '/page2':
-        return page2.layout
+        return page2.layout()
     if pathname == '/page3':
-        return page3.layout
+        return page3.layout()
+    if pathname == '/page4':
+        return page4.layout()
     else: # if redirected to unknown link
         return "404 Page Error! Please choose a link"
 
 
+## Instrument every callback registered above (latency, payload size, /metrics endpoint)
+metrics.instrument(app)
+
+## Bulk query API streaming NDJSON (/api/v1/<dataset>/...), reading the structures the pages register
+api.enable(app)
+
+
 
 
 
 
 
 
-# Run the app on localhost:8050
+# Run the development server (in production: gunicorn -c gunicorn.conf.py wsgi:server)
 if __name__ == '__main__':
-    app.run_server(debug=True, host='0.0.0.0', port='80')
+    app.run_server(debug=os.environ.get("dash_debug", "True") == "True", host='0.0.0.0',
+                   port=os.environ.get("dash_port", "80"))
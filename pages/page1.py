@@ -1,261 +1,390 @@
-from dash import Dash, html, dcc, Output, Input
-import dash, dash_table
-import dash_bootstrap_components as dbc
-import dash_daq as daq
-from dash.exceptions import PreventUpdate
+from dash import html, dcc
+import dash_table
 import plotly.express as px
 import pandas as pd
-
-import matplotlib.pyplot as plt
 import numpy as np
-import matplotlib
-import seaborn as sns
-
-from matplotlib.patches import Rectangle
-
-app = Dash(__name__)
-## Read in data
-
-### Shorthouse data
-shorthouse_data = pd.read_csv("./Data/Mutation_metabolite_associations_ordered_shorthouse.csv", index_col = "Unnamed: 0")
-
-### Cherkaoui data
-cherkaoui_data = pd.read_csv("./Data/Mutation_metabolite_associations_ordered_cherkaoui.csv", index_col = "Unnamed: 0")
+import os
+
+from utils.registry import registry
+from utils.matrices import Matrix
+from utils.rankings import Rankings, ranking_frame
+from utils.tiles import Pyramid, block_labels
+from utils import bundles, clustering, heatmaps
+from utils.artifacts import artifacts, DEFAULTS
+from utils.tables import PagedTable
+from utils.search import SearchIndex
+
+## Data is loaded on first use through the registry (see utils/registry.py):
+##   registry.get("tstats", dataset)             - T-statistics, ions x genes
+##   registry.get("metabolite_lookup", dataset)  - metabolite table for display
+##   registry.get("metabolite_levels", dataset)  - original data, ions x samples
+##   registry.get("diff_expr", dataset)          - differential expression, ions x genes
+##   registry.get("cellline_mutations")          - mutational data for celllines
+##   registry.get("cellline_mapping", dataset)   - mapping for celllines
 
 ## Generate colour scheme
-palette_cmap = sns.diverging_palette(237, 8.7, s= 99, l = 50, as_cmap = True)
-palette_cmap._init()
-rgbas = palette_cmap._lut
-hexes = [matplotlib.colors.rgb2hex(x) for x in rgbas]
-
-
-## Read in metabolite table for display
-metabolite_lookup_shorthouse = pd.read_csv("./Data/Metabolite_reference_table_shorthouse.csv")
-metabolite_lookup_shorthouse = metabolite_lookup_shorthouse[["ionIdx","id", "score", "name"]]
-
-metabolite_lookup_cherkaoui = pd.read_csv("./Data/Metabolite_reference_table_cherkaoui.csv")
-metabolite_lookup_cherkaoui = metabolite_lookup_cherkaoui[["ionIdx","id", "score", "name"]]
-
-## Read in original data
-metabolite_levels_shorthouse = pd.read_csv("./Data/Metabolite_levels_shorthouse.csv", index_col = "ionIdx")
-metabolite_levels_shorthouse = metabolite_levels_shorthouse.drop("ionMz", axis =1)
-
-metabolite_levels_cherkaoui = pd.read_csv("./Data/Metabolite_levels_cherkaoui.csv", index_col = "ionIdx")
-metabolite_levels_cherkaoui = metabolite_levels_cherkaoui.drop("ionMz", axis =1)
+@registry.builder("heatmap_colours_page1", per_dataset = False)
+def heatmap_colours(dataset = None):
+    import matplotlib
+    import seaborn as sns
+
+    palette_cmap = sns.diverging_palette(237, 8.7, s= 99, l = 50, as_cmap = True)
+    palette_cmap._init()
+    rgbas = palette_cmap._lut
+    hexes = [matplotlib.colors.rgb2hex(x) for x in rgbas]
+    return hexes
+
+## function for building an ionIdx -> name string index for a metabolite table
+def metaboname_index(metabolite_dataframe, headnumber = 2):
+    metabolite_names = metabolite_dataframe.groupby("ionIdx", sort = False).head(headnumber)
+    metabolite_names = metabolite_names.dropna(subset = ["name"]).groupby("ionIdx", sort = False)["name"].agg("/".join)
+    ion_ids = pd.Index(metabolite_dataframe["ionIdx"].unique())
+    metabolite_names = metabolite_names.reindex(ion_ids, fill_value = "")
+    metabolite_strings = (ion_ids.astype(str) + ": " + metabolite_names.values).str[:50]
+
+    return dict(zip(ion_ids.tolist(), metabolite_strings))
+
+## Name indexes for a dataset, keyed by the number of names joined per ion
+@registry.builder("metabolite_names")
+def metabolite_names_index(dataset):
+    metabolite_lookup = registry.get("metabolite_lookup", dataset)
+    return {1: metaboname_index(metabolite_lookup, 1), 2: metaboname_index(metabolite_lookup, 2)}
 
 ## function for generating metabolite name string from id
 def metaboname(metaboid, dataset = "shorthouse", headnumber =2):
-    if dataset == "shorthouse":
-        metabolite_dataframe = metabolite_lookup_shorthouse
-    elif dataset == "cherkaoui":
-        metabolite_dataframe = metabolite_lookup_cherkaoui
-
-    metabolite_names = metabolite_dataframe[metabolite_dataframe["ionIdx"] == metaboid]
-    metabolite_names = metabolite_names["name"].head(headnumber).str.cat(sep = "/")
-    metabolite_string = str(metaboid) + ": " + metabolite_names
-
-    return metabolite_string[:50]
-
-
-
-## Generating name series for labels to use as default
-metabolite_series_shorthouse = pd.Series([metaboname(i, "shorthouse", 1) for i in shorthouse_data.index.tolist()], name = "metabolite")
-metabolite_series_cherkaoui = pd.Series([metaboname(i, "shorthouse", 1) for i in cherkaoui_data.index.tolist()], name = "metabolite")
-## Reading in differential expression metabolite data
-metabolite_diff_expr_shorthouse = pd.read_csv("./Data/Mutation_differential_expression_shorthouse.csv", index_col = "ionIdx")
-metabolite_diff_expr_cherkaoui = pd.read_csv("./Data/Mutation_differential_expression_cherkaoui.csv", index_col = "ionIdx")
-
-## Reading in mutational data for celllines
-celline_mutation_database = pd.read_csv("./Data/Mutations_in_celllines.csv")
-
-## Read in mapping for celllines
-celline_mapping_shorthouse = pd.read_csv("./Data/Cellline_mappings_shorthouse.csv")
-celline_mapping_cherkaoui = pd.read_csv("./Data/Cellline_mappings_cherkaoui.csv")
+    dataset_index = registry.get("metabolite_names", dataset)
+    if headnumber not in dataset_index:
+        dataset_index[headnumber] = metaboname_index(registry.get("metabolite_lookup", dataset), headnumber)
+
+    metabolite_string = dataset_index[headnumber].get(metaboid)
+    if metabolite_string is None:
+        metabolite_string = (str(metaboid) + ": ")[:50]
+
+    return metabolite_string
+
+## Sorted rows/columns of the T-statistics for the ranking and volcano plots
+@registry.builder("tstats_rankings")
+def tstats_rankings(dataset):
+    return Rankings(registry.get("tstats", dataset))
+
+## Metabolite table with the sort order of each column, for server-side paging (see utils/tables.py)
+@registry.builder("metabolite_table")
+def metabolite_table(dataset):
+    return PagedTable(registry.get("metabolite_lookup", dataset))
+
+## Typeahead index of the metabolites, found by ion id, names and HMDB ids (see utils/search.py)
+@registry.builder("metabolite_search")
+def metabolite_search(dataset):
+    metabolite_lookup = registry.get("metabolite_lookup", dataset)
+    annotations = pd.concat([metabolite_lookup[["ionIdx", "id"]].set_axis(["ionIdx", "key"], axis = 1),
+                             metabolite_lookup[["ionIdx", "name"]].set_axis(["ionIdx", "key"], axis = 1)]).dropna()
+    annotations = annotations.groupby("ionIdx", sort = False)["key"].agg(list).to_dict()
+    ion_ids = registry.get("tstats", dataset).index.sort_values().tolist()
+    return SearchIndex([{'label': metaboname(i, dataset), 'value': i} for i in ion_ids],
+                       [[i] + annotations.get(i, []) for i in ion_ids])
+
+## Typeahead index of the genes with differential expression data
+@registry.builder("gene_search")
+def gene_search(dataset):
+    genes = registry.get("diff_expr", dataset).columns.tolist()
+    return SearchIndex([{"label": i, "value": i} for i in genes], [[i] for i in genes])
+
+## Rows per page of the metabolite table
+TABLE_PAGE_SIZE = 25
+
+## Multi-resolution T-statistics for the heatmap (see utils/tiles.py)
+@registry.builder("tstats_pyramid")
+def tstats_pyramid(dataset):
+    return Pyramid(registry.get("tstats", dataset).to_numpy())
+
+## Clustered T-statistics for the heatmap: their pyramid and the row and column labels in that order
+## (the file-order pyramid while no clustering is stored)
+@registry.builder("tstats_clustered")
+def tstats_clustered(dataset):
+    data = registry.get("tstats", dataset)
+    orders = clustering.stored_orders("tstats", dataset, data.shape)
+    if orders is None:
+        return registry.get("tstats_pyramid", dataset), data.index, data.columns
+    rows, columns = orders
+    values = np.ascontiguousarray(data.to_numpy()[rows][:, columns], dtype = np.float32)
+    return Pyramid(values), data.index[rows], data.columns[columns]
+
+## Most heatmap cells sent to the browser for one view
+HEATMAP_CELLS = int(os.environ.get("dash_heatmap_cells", 10000))
+
+## log10 metabolite levels for the swarmplot, ions x celllines: the samples joined to their cellline
+## IDs (in sample order, as an inner merge), then grouped by ID in order of first appearance
+## (as the outer merge with the mutations)
+@registry.builder("cellline_levels")
+def cellline_levels(dataset):
+    metabolite_levels = registry.get("metabolite_levels", dataset)
+    cellline_mappings = registry.get("cellline_mapping", dataset)
+
+    samples = pd.DataFrame({"dsIdx": pd.to_numeric(pd.Series(metabolite_levels.columns)), "position": range(metabolite_levels.shape[1])})
+    samples = samples.merge(pd.DataFrame({"dsIdx": pd.to_numeric(cellline_mappings["dsIdx"]), "ID": cellline_mappings["ID"]}), on = "dsIdx")
+    samples = samples.iloc[np.argsort(pd.factorize(samples["ID"])[0], kind = "stable")]
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        levels = np.log10(metabolite_levels.to_numpy()[:, samples["position"].to_numpy()])
+    return Matrix(pd.DataFrame(levels, index = metabolite_levels.index, columns = pd.Index(samples["ID"].to_numpy(), name = "ID")))
+
+## Effect classes of the volcano plot, by their int8 code
+VOLCANO_EFFECTS = np.array(["Neutral", "Highly Decreased", "Highly Increased"])
+
+## Volcano plot inputs aligned once per dataset on the sorted ion ids of the T-statistics:
+## per gene (rows of genes x ions arrays) the |T-statistic|, the differential expression and the effect code
+@registry.builder("volcano_data")
+def volcano_data(dataset):
+    tstats = registry.get("tstats", dataset)
+    diff_expr = registry.get("diff_expr", dataset)
+    ion_ids = tstats.index.sort_values()
+    genes = tstats.columns[tstats.columns.isin(diff_expr.columns)]
+
+    abs_tstats = np.abs(tstats.loc[ion_ids, genes].to_numpy()).T
+    diff = diff_expr.reindex(index = ion_ids, columns = genes).to_numpy().T
+    effects = np.zeros(abs_tstats.shape, dtype = np.int8)
+    effects[(abs_tstats >= 5) & (diff < 0)] = 1
+    effects[(abs_tstats >= 5) & (diff > 0)] = 2
+    return {
+        "genes": {gene: position for position, gene in enumerate(genes)},
+        "metabolite": np.array([metaboname(i, dataset, 1) for i in ion_ids.tolist()], dtype = object),
+        "tstat": np.ascontiguousarray(abs_tstats, dtype = np.float32),
+        "diffexpr": np.ascontiguousarray(diff, dtype = np.float32),
+        "effect": np.ascontiguousarray(effects),
+    }
+
+## function for building a gene -> mutant cellline table (ID, Mutation, Mutant) for a dataset
+@registry.builder("mutation_index")
+def mutation_index(dataset):
+    cellline_mutations = registry.get("cellline_mutations")
+    metabolite_levels = registry.get("metabolite_levels", dataset)
+    cellline_mappings = registry.get("cellline_mapping", dataset)
+## Celllines with metabolite measurements in this dataset
+    measured_dsidx = pd.to_numeric(pd.Series(metabolite_levels.columns))
+    measured_celllines = cellline_mappings.loc[pd.to_numeric(cellline_mappings["dsIdx"]).isin(measured_dsidx), "ID"].unique()
+## Nonsynonymous mutations in those celllines
+    mutations = cellline_mutations[(cellline_mutations["MutationType"] != "Silent") & cellline_mutations["MutationType"].notna()]
+    mutations = mutations[mutations["CellLineName_Cellosaurus"].isin(measured_celllines)]
+    mutations = mutations[["HGNC", "CellLineName_Cellosaurus", "AA_Mutation"]].fillna({"AA_Mutation": "unknown"}).drop_duplicates()
+## Merge mutations per cellline, then keep the first cellline per distinct mutation string
+    mutations = mutations.groupby(["HGNC", "CellLineName_Cellosaurus"], sort = False)["AA_Mutation"].agg(", ".join).reset_index()
+    mutations.columns = ["HGNC", "ID", "Mutation"]
+    mutations = mutations.drop_duplicates(subset = ["HGNC", "Mutation"])
+## Count up the mutations for colouring
+    mutations["Mutant"] = mutations.groupby("HGNC", sort = False).cumcount() + 1
+
+    return {gene: gene_mutations[["ID", "Mutation", "Mutant"]].reset_index(drop = True)
+            for gene, gene_mutations in mutations.groupby("HGNC", sort = False)}
+
+## Empty table for genes without mutations in a dataset
+no_mutations = pd.DataFrame({"ID": pd.Series(dtype = object), "Mutation": pd.Series(dtype = object), "Mutant": pd.Series(dtype = "int64")})
+
+## Mutation label per mutant cellline ID for a gene (empty for genes without mutations in a dataset)
+def mutations_by_gene_label(mutation_gene, dataset):
+    mutations = registry.get("mutation_index", dataset).get(mutation_gene, no_mutations)
+    return pd.Series(mutations["Mutation"].to_numpy(), index = mutations["ID"].to_numpy(), dtype = object)
 
 #-------------------------------------
 # Layout
 
+## Callback outputs for the default selections, embedded in the layout (see utils/artifacts.py)
+def default_outputs(defaults):
+    dataset = defaults["dataset"]
+    heatmap, values, view = plot_heatmap_tstats(dataset)
+    table_data, table_page_count = metabolite_table_page(0, TABLE_PAGE_SIZE, [], "", dataset)
+    return {
+        "table1": {"data": table_data, "page_count": table_page_count},
+        "heatmap_top1": {"figure": heatmap},
+        "heatmap_top1_values": {"data": values},
+        "heatmap_top1_view": {"data": view},
+        "metabolite_id": {"options": metabolite_options(None, dataset, defaults["metabolite"])},
+        "mutation_id": {"options": gene_options(None, dataset, defaults["gene"])},
+        "mutation_ranking_per_metabolite": {"figure": mutation_ranking_per_metabolite_plot(defaults["metabolite"], dataset)},
+        "mutation_volcano_plot": {"figure": volcano_plot_per_mutation(defaults["gene"], dataset)},
+        "swarmplot_metabolite": {"figure": swarmplot_per_metabolite_permutation(defaults["metabolite"], defaults["gene"], dataset)},
+    }
+
+## Built when the page is opened, so the default dataset is only loaded then
+def layout():
+    defaults = artifacts.get("page1", default_outputs)
+
+    return html.Div(children=[
+        html.Br() ,
+        html.H1(children='Influence of Mutations on Metabolite Abundance',style={'textAlign': 'center'}),
 
-layout = html.Div(children=[
-    dcc.Store(
-        id="metabolite_table",
-        data=metabolite_lookup_shorthouse.to_dict("rows")
-    ),
-
-    html.Br() ,
-    html.H1(children='Influence of Mutations on Metabolite Abundance',style={'textAlign': 'center'}),
-
-    html.Div(children='''
-        This page contains plots to explore the relationships between nonsynonymous mutations and metabolites. Included are a heatmap of T-statistics (proportional to a p-value) for a logistic regression run on every nonsynonymous mutation/metabolite pairing. Click and drag to zoom.
-        Scroll down for the metabolite table, and to explore the relationships between specific metabolites and mutations using the dropdown menus.
-    ''',style={'textAlign': 'center'}),
-
-    html.Br(),
-    html.Div(children='''
-        This data has been normalised in two differing ways - please see the relevant publications for details, but toggle between them below - default is Shorthouse et al.
+        html.Div(children='''
+            This page contains plots to explore the relationships between nonsynonymous mutations and metabolites. Included are a heatmap of T-statistics (proportional to a p-value) for a logistic regression run on every nonsynonymous mutation/metabolite pairing. Click and drag to zoom.
+            Scroll down for the metabolite table, and to explore the relationships between specific metabolites and mutations using the dropdown menus.
         ''',style={'textAlign': 'center'}),
 
-    dcc.RadioItems(
-    options=[
-       {'label': 'Shorthouse et al  ', 'value': 'shorthouse'},
-       {'label': 'Cherkaoui et al', 'value': 'cherkaoui'}], value = 'shorthouse',
-    inline=True, style={'textAlign': 'center'}, inputStyle={"margin-right": "5px", "margin-left": "5px"},
-    id = 'dataset_type'),
-
-    ## Heatmap figure
-    dcc.Graph(
-        id='heatmap_top1',
-        ## add box-shadow below
-        style = {'padding': 10}
-    ),
-
-    html.Div([
-
-        # Graph container
-        html.Div([
+        html.Br(),
+        html.Div(children='''
+            This data has been normalised in two differing ways - please see the relevant publications for details, but toggle between them below - default is Shorthouse et al.
+            ''',style={'textAlign': 'center'}),
+
+        dcc.RadioItems(
+        options=[
+           {'label': 'Shorthouse et al  ', 'value': 'shorthouse'},
+           {'label': 'Cherkaoui et al', 'value': 'cherkaoui'}], value = DEFAULTS["dataset"],
+        inline=True, style={'textAlign': 'center'}, inputStyle={"margin-right": "5px", "margin-left": "5px"},
+        id = 'dataset_type'),
+        ## Data of the ranking and volcano plots, drawn in the browser (see utils/bundles.py),
+        ## loaded on the first change of a selection, and the dataset it was loaded for
+        dcc.Store(id = 'page1_bundle'),
+        dcc.Store(id = 'page1_bundle_dataset'),
+
+        ## Order of the heatmap rows and columns
+        dcc.RadioItems(options = clustering.ORDERING_OPTIONS, value = "file", id = 'heatmap_top1_ordering',
+            inline=True, style={'textAlign': 'center'}, inputStyle={"margin-right": "5px", "margin-left": "5px"}),
+        ## Heatmap figure
+        dcc.Graph(
+            id='heatmap_top1',
+            ## add box-shadow below
+            style = {'padding': 10},
+            **defaults["heatmap_top1"]
+        ),
+        ## Hover values of the heatmap in image mode (see utils/heatmaps.py)
+        html.Div(id = 'heatmap_top1_hover', style = {'textAlign': 'center', 'minHeight': '1.5em'}),
+        dcc.Store(id = 'heatmap_top1_values', **defaults["heatmap_top1_values"]),
+        ## Region and resolution of the heatmap currently shown
+        dcc.Store(id = 'heatmap_top1_view', **defaults["heatmap_top1_view"]),
 
-            ## Metabolite table
-            dash_table.DataTable(
-                id='table1',
-                columns = [{"name": i, "id": i} for i in ["ionIdx","id", "score", "name"]],
-                style_cell={'textAlign':'center','minWidth': 95, 'maxWidth': 95, 'width': 95,'font_size': '12px','whiteSpace':'normal','height':'auto'},
-                data = metabolite_lookup_shorthouse.to_dict("rows"),
-                #data = metabolite_lookup.to_dict("rows"),
-                #style_table={'overflow':'scroll','height':550},
-                fixed_rows={'headers': True, 'data': 0},
-                fixed_columns={'headers': True, 'data': 0},
-                fill_width=False,
-                style_cell_conditional=[
-                    {
-                        'if': {'column_id': "name"},
-                        'minWidth': 400,
-                        'width': 400,
-                        "maxWidth": 400
-                    },
-                ],
-            ),
-
-        ], style={'width': '49%', 'display': 'inline-block', 'padding': 10}),
-
-        # Table container
         html.Div([
 
-    ## Dropdown for metabolites
-            dcc.Dropdown(id = "metabolite_id"
-                 #options = [{'label': i, 'value': i} for i in shorthouse_data.index.tolist()],
-                 ,value = 1
-                 ,searchable = True
-                 ,placeholder = "Peak id..."
-                 ,clearable = True
-                 ),
-    ## Metabolite ranking graph
-            dcc.Graph(id = "mutation_ranking_per_metabolite"),
+            # Graph container
+            html.Div([
+
+                ## Metabolite table
+                dash_table.DataTable(
+                    id='table1',
+                    columns = [{"name": i, "id": i} for i in ["ionIdx","id", "score", "name"]],
+                    style_cell={'textAlign':'center','minWidth': 95, 'maxWidth': 95, 'width': 95,'font_size': '12px','whiteSpace':'normal','height':'auto'},
+                    ## Paged, filtered and sorted by the server (metabolite_table_page)
+                    page_action = "custom",
+                    filter_action = "custom",
+                    sort_action = "custom",
+                    sort_mode = "single",
+                    page_current = 0,
+                    page_size = TABLE_PAGE_SIZE,
+                    **defaults["table1"],
+                    #style_table={'overflow':'scroll','height':550},
+                    fixed_rows={'headers': True, 'data': 0},
+                    fixed_columns={'headers': True, 'data': 0},
+                    fill_width=False,
+                    style_cell_conditional=[
+                        {
+                            'if': {'column_id': "name"},
+                            'minWidth': 400,
+                            'width': 400,
+                            "maxWidth": 400
+                        },
+                    ],
+                ),
+
+            ], style={'width': '49%', 'display': 'inline-block', 'padding': 10}),
+
+            # Table container
+            html.Div([
+
+        ## Dropdown for metabolites
+                dcc.Dropdown(id = "metabolite_id"
+                     #options = [{'label': i, 'value': i} for i in shorthouse_data.index.tolist()],
+                     ,value = DEFAULTS["metabolite"]
+                     ,options = defaults["metabolite_id"]["options"]
+                     ,searchable = True
+                     ,placeholder = "Peak id..."
+                     ,clearable = True
+                     ),
+        ## Metabolite ranking graph
+                dcc.Graph(id = "mutation_ranking_per_metabolite", **defaults["mutation_ranking_per_metabolite"]),
 
-        ], style={'width': '52%', 'display': 'inline-block', 'padding': 10}),
+            ], style={'width': '52%', 'display': 'inline-block', 'padding': 10}),
 
-    ], style={'display': 'flex'}),
+        ], style={'display': 'flex'}),
 
 
 
 
-    ## Dropdown for mutations
-    html.Div([
-        html.Div([
-            dcc.Dropdown(id = "mutation_id",
-                 options = [{"label": i, "value": i} for i in metabolite_diff_expr_shorthouse.columns],
-                 value = "A1CF",
-                 placeholder = "Gene",
-                 clearable = True,
-                 searchable = True),
-    ## Mutation volcano plot graph
-            dcc.Graph(id = "mutation_volcano_plot")], style={'width': '49%', 'display': 'inline-block', 'padding': 10}),
-
-    ## Metabolite/Mutation swarmplot
-        html.Br() ,
+        ## Dropdown for mutations
         html.Div([
-            dcc.Graph(id = "swarmplot_metabolite"),
-            ], style={'width': '52%', 'display': 'inline-block', 'padding': 10}),
-        ], style = {'display': 'flex'})
-
-])
+            html.Div([
+                dcc.Dropdown(id = "mutation_id",
+                     options = defaults["mutation_id"]["options"],
+                     value = DEFAULTS["gene"],
+                     placeholder = "Gene",
+                     clearable = True,
+                     searchable = True),
+        ## Mutation volcano plot graph
+                dcc.Graph(id = "mutation_volcano_plot", **defaults["mutation_volcano_plot"])], style={'width': '49%', 'display': 'inline-block', 'padding': 10}),
+
+        ## Metabolite/Mutation swarmplot
+            html.Br() ,
+            html.Div([
+                dcc.Graph(id = "swarmplot_metabolite", **defaults["swarmplot_metabolite"]),
+                ], style={'width': '52%', 'display': 'inline-block', 'padding': 10}),
+            ], style = {'display': 'flex'})
+
+    ])
 
 #-------------------------------------------
+## Data and figure functions, registered as callbacks in main.py
+
 ## Callback for heatmap dataset
-@app.callback(
-    Output(component_id = 'heatmap_top1', component_property = 'figure'),
-    Input(component_id = 'dataset_type', component_property = 'value')
-)
-
-def plot_heatmap_tstats(dataset):
-    if dataset == "shorthouse":
-        data = shorthouse_data
-    elif dataset == "cherkaoui":
-        data = cherkaoui_data
-
-    original_index = data.index.tolist()
-    original_index = [str(i) for i in original_index]
-    data = data.reset_index()
-    new_index = data.index.tolist()
-    data = data.drop("index", axis =1)
+## region: dict with row_start/row_stop/column_start/column_stop of the T-statistics to show (all by default);
+## ordering: "file" or "clustered" rows and columns (see utils/clustering.py).
+## Returns the figure, its hover values (image mode only) and the view it shows;
+## regions over the cell budget are drawn from a coarser level
+def plot_heatmap_tstats(dataset, region = None, ordering = "file"):
+    data = registry.get("tstats", dataset)
+    if ordering == "clustered":
+        pyramid, index, columns = registry.get("tstats_clustered", dataset)
+    else:
+        pyramid, index, columns = registry.get("tstats_pyramid", dataset), data.index, data.columns
+    hexes = registry.get("heatmap_colours_page1")
+
+    if region is None:
+        region = {"row_start": 0, "row_stop": data.shape[0], "column_start": 0, "column_stop": data.shape[1]}
+    z, level, row_start, row_stop, column_start, column_stop = pyramid.region(
+        region["row_start"], region["row_stop"], region["column_start"], region["column_stop"], HEATMAP_CELLS)
+    factor = 2 ** level
+    genes = block_labels(columns, column_start, column_stop, factor)
+    metabolites = block_labels(index, row_start, row_stop, factor)
+
+    title = "T-statistics for Mutation/Metabolite Pairings"
+    if factor > 1:
+        title += f" (strongest of each {factor}x{factor} block, zoom in for detail)"
+    labels = dict(x="Gene", y="Metabolite", color="T-Statistic")
     ## Plot heatmap
-    heatmap = px.imshow(data,y=original_index, x = data.columns, zmin = -15, zmax = 15, color_continuous_scale=list(hexes[:-3]),
-                    labels=dict(x="Gene", y="Metabolite", color="T-Statistic"), aspect="auto", title = "T-statistics for Mutation/Metabolite Pairings")
-    return heatmap
-
-# Callback for table sort_values
-@app.callback(
-    Output(component_id = "metabolite_table", component_property = "data"),
-    [Input(component_id = "dataset_type", component_property = "value")]
-)
-
-def generate_tabledata(dataset):
-    print(dataset)
-    if dataset == "shorthouse":
-        data = metabolite_lookup_shorthouse
-    elif dataset == "cherkaoui":
-        data = metabolite_lookup_cherkaoui
-    return data.to_dict("rows")
-
-# callback for updating table1
-@app.callback(Output('table1', 'data'),
-              Input('metabolite_table', 'data'))
-def on_data_set_table(data):
-    if data is None:
-        raise PreventUpdate
-
-    return data
-
-## Callback for updating dropdowns
-@app.callback(
-    Output(component_id = "metabolite_id", component_property = "options"),
-    [Input(component_id = "dataset_type", component_property = "value")]
-)
-def dropdown_update(dataset):
-    if dataset == "shorthouse":
-        metabolite_dropdown = [{'label': metaboname(i, dataset), 'value': i} for i in shorthouse_data.sort_index().index.tolist()]
-    elif dataset == "cherkaoui":
-        metabolite_dropdown = [{'label': metaboname(i, dataset), 'value': i} for i in cherkaoui_data.sort_index().index.tolist()]
-    return metabolite_dropdown
+    if heatmaps.PAYLOAD == "png":
+        heatmap, values = heatmaps.image_heatmap(z, genes, metabolites, hexes[:-3], -15, 15, labels, title = title)
+    else:
+        ## Pooled levels are float32: round as float64 so the JSON holds the rounded values (6.051, not 6.051000118255615)
+        heatmap = px.imshow(np.round(z.astype(np.float64), 3), y = metabolites, x = genes, zmin = -15, zmax = 15,
+                        color_continuous_scale=list(hexes[:-3]), labels=labels, aspect="auto", title = title)
+        ## Ion ids look numeric: categorical axes keep relayoutData ranges in row/column positions (see utils/tiles.py)
+        heatmap.update_xaxes(type = "category")
+        heatmap.update_yaxes(type = "category")
+        values = None
+    view = {"dataset": dataset, "ordering": ordering, "row_start": row_start, "row_stop": row_stop,
+            "column_start": column_start, "column_stop": column_stop, "factor": factor}
+    return heatmap, values, view
+
+# Callback for a page of table1
+def metabolite_table_page(page_current, page_size, sort_by, filter_query, dataset):
+    return registry.get("metabolite_table", dataset).page(page_current, page_size, sort_by, filter_query)
+
+## Callbacks for dropdown options matching the typed search (plus the selected value)
+def metabolite_options(search_value, dataset, value):
+    return registry.get("metabolite_search", dataset).dropdown_options(search_value, value)
+
+def gene_options(search_value, dataset, value):
+    return registry.get("gene_search", dataset).dropdown_options(search_value, value)
 
 ## Callback for mutation rankings per metabolite
-@app.callback(
-    Output(component_id = "mutation_ranking_per_metabolite", component_property = "figure"),
-    [Input(component_id = "metabolite_id", component_property = "value"),
-    Input(component_id = "dataset_type", component_property = "value")]
-)
-
 ## Function to extract metabolite column from dataframe and plot scatterplot
 def mutation_ranking_per_metabolite_plot(metabolite_id_value,dataset):
-    if dataset == "shorthouse":
-        tstat_dataframe = shorthouse_data
-    elif dataset == "cherkaoui":
-        tstat_dataframe = cherkaoui_data
     metabolite_names = metaboname(metabolite_id_value, dataset)
-    metabolite = pd.DataFrame(tstat_dataframe.loc[metabolite_id_value].sort_values())
-    metabolite.columns = ["T-Statistic"]
-    metabolite["Gene"] = metabolite.index
-    metabolite = metabolite.reset_index()
-    metabolite["Mutation Rank"] = metabolite.index+1
+    genes, tstats = registry.get("tstats_rankings", dataset).sorted_row(metabolite_id_value)
+    metabolite = ranking_frame(genes, tstats, "Mutation Rank", "T-Statistic", "Gene")
 
     scatterplot = px.scatter(metabolite, x = "Mutation Rank", y = "T-Statistic", hover_name = "Gene"
                              ,title = "Mutation rankings for " + metabolite_names, template="simple_white")
@@ -263,37 +392,21 @@ def mutation_ranking_per_metabolite_plot(metabolite_id_value,dataset):
     return scatterplot
 
 ## Callback for volcano plot based on mutations
-@app.callback(
-    Output(component_id = "mutation_volcano_plot", component_property = "figure"),
-    [Input(component_id = "mutation_id", component_property = "value"),
-    Input(component_id = "dataset_type", component_property = "value")]
-)
-
 ## Function to generate data for plotting volcano plot
 def volcano_plot_per_mutation(mutation_name, dataset):
-    # Get data
-    if dataset == "shorthouse":
-        tstat_dataframe = shorthouse_data
-        diff_expr = metabolite_diff_expr_shorthouse
-        metabolite_series_names = metabolite_series_shorthouse
-    elif dataset == "cherkaoui":
-        tstat_dataframe = cherkaoui_data
-        diff_expr = metabolite_diff_expr_cherkaoui
-        metabolite_series_names = metabolite_series_cherkaoui
-    tstat_sorted = tstat_dataframe.sort_index()
-# get mutation of interest and merge frames
-    mutation_tstat = tstat_sorted[mutation_name]
-    diff_expr_mutation = diff_expr[mutation_name]
-    mutation_tstat = abs(mutation_tstat)
-    plotting_frame = pd.concat([mutation_tstat, diff_expr_mutation, metabolite_series_names], axis=1)
-    plotting_frame.columns = ["tstat", "diffexpr", "metabolite"]
-
-# Generate color column
-    plotting_frame["colour"] = np.where((plotting_frame["tstat"] >= 5) & (plotting_frame["diffexpr"] >0), "Highly Increased",
-                                        np.where((plotting_frame["tstat"] >= 5) & (plotting_frame["diffexpr"] <0), "Highly Decreased",
-                                                 "Neutral"))
+    # Get data for the mutation of interest (aligned rows, see volcano_data)
+    volcano = registry.get("volcano_data", dataset)
+    gene = volcano["genes"][mutation_name]
+    plotting_frame = pd.DataFrame({
+        "tstat": volcano["tstat"][gene].astype(np.float64).round(4),
+        "diffexpr": volcano["diffexpr"][gene].astype(np.float64).round(6),
+        "metabolite": volcano["metabolite"],
+        "colour": VOLCANO_EFFECTS[volcano["effect"][gene]],
+    })
+
     volcanoplot = px.scatter(plotting_frame, y = "tstat", x = "diffexpr", color = "colour",
-                             color_discrete_sequence = ["grey", "blue", "red"], hover_name = "metabolite",
+                             color_discrete_sequence = ["grey", "blue", "red"], category_orders = {"colour": list(VOLCANO_EFFECTS)},
+                             hover_name = "metabolite",
                              labels={
                                  "tstat": "T-Statistic",
                                  "diffexpr": "Metabolite log(10) Difference",
@@ -303,59 +416,35 @@ def volcano_plot_per_mutation(mutation_name, dataset):
                              )
     return volcanoplot
 
-## Callback for mutation swarmplot
-@app.callback(
-    Output(component_id = "swarmplot_metabolite", component_property = "figure"),
-    [Input(component_id = "metabolite_id", component_property = "value"),
-    Input(component_id = "mutation_id", component_property = "value"),
-    Input(component_id = "dataset_type", component_property = "value")]
-)
+## Callback for the data of the ranking and volcano plots drawn in the browser (assets/rankings.js):
+## the T-statistics with the metabolite names of their rows, and the volcano inputs aligned on
+## the sorted ion ids (rows: positions of those ions in the T-statistics)
+def clientside_bundle(dataset):
+    tstats = registry.get("tstats_rankings", dataset)
+    volcano = registry.get("volcano_data", dataset)
+    ion_ids = tstats.index.tolist()
+    return bundles.bundle(dataset,
+        tstats = bundles.ranking_matrix(tstats),
+        metabolite_names = [metaboname(i, dataset) for i in ion_ids],
+        volcano = {
+            "genes": list(volcano["genes"]),
+            "rows": tstats.index.get_indexer(tstats.index.sort_values()).tolist(),
+            "metabolite": volcano["metabolite"].tolist(),
+            "diffexpr": bundles.typed_array(volcano["diffexpr"]),
+        })
 
+## Callback for mutation swarmplot
 def swarmplot_per_metabolite_permutation(metabolite_id_value, mutation_gene, dataset):
-# Copy dataframes
-    if dataset == "shorthouse":
-        metabolite_levels_base = metabolite_levels_shorthouse
-        cellline_mappings_2 = celline_mapping_shorthouse
-    elif dataset == "cherkaoui":
-        metabolite_levels_base = metabolite_levels_cherkaoui
-        cellline_mappings_2 = celline_mapping_cherkaoui
-
-    cellline_mutations = celline_mutation_database
-
-    cellline_mappings_short = cellline_mappings_2[["dsIdx", "ID"]]
-    cellline_mappings_short["dsIdx"] = cellline_mappings_short["dsIdx"].apply(pd.to_numeric)
-# Get only the metabolite we want
-    metabolite_only = pd.DataFrame(metabolite_levels_base.T[metabolite_id_value])
-    metabolite_only["dsIdx"] = metabolite_only.index
-    metabolite_only["dsIdx"] = metabolite_only["dsIdx"].apply(pd.to_numeric)
-    metabolite_cellines = metabolite_only.merge(cellline_mappings_short, left_on = "dsIdx", right_on = "dsIdx")
-#Get list of celllines
-    celllines_list = metabolite_cellines["ID"].unique().tolist()
-
-    ## now have metabolite level for each cell line TAG - need to map to mutational status.
-
-#Get only the celllines which have mutations in gene of interest
-    gene_of_interest = cellline_mutations[cellline_mutations["HGNC"] == mutation_gene]
-    gene_of_interest = gene_of_interest[gene_of_interest["MutationType"] != "Silent"]
-    gene_of_interest = gene_of_interest[gene_of_interest["MutationType"].notna()]
-    #print(gene_of_interest)
-## Get only celllines in our dataset
-    celllines_with_gene_of_interest = gene_of_interest[gene_of_interest["CellLineName_Cellosaurus"].isin(celllines_list)]
-## Merge mutations
-    celllines_with_gene_of_interest["Mutation"] = celllines_with_gene_of_interest.groupby(['CellLineName_Cellosaurus'])['AA_Mutation'].transform(lambda x : ', '.join(x.unique()))
-    celllines_with_gene_of_interest = celllines_with_gene_of_interest.drop_duplicates(subset = "Mutation")[["CellLineName_Cellosaurus", "Mutation"]]
-    celllines_with_gene_of_interest.columns = ["ID", "Mutation"]
-    #print(celllines_with_gene_of_interest)
-## Add a column that counts up the mutations for colouring
-    celllines_with_gene_of_interest["Mutant"] = range(1,len(celllines_with_gene_of_interest)+1)
-## Merge our values with our labels
-    plotting_dataframe = metabolite_cellines.merge(celllines_with_gene_of_interest, how = "outer", left_on = 'ID',
-                                                   right_on = "ID")
-## Fill the dataframe NaNs with 0 or "-"
-    plotting_dataframe["Mutant"] = plotting_dataframe["Mutant"].fillna(0)
-    plotting_dataframe["Mutation"] = plotting_dataframe["Mutation"].fillna(" -")
-## Log 10 transform the data
-    plotting_dataframe[metabolite_id_value] = np.log10(plotting_dataframe[metabolite_id_value])
+# log10 levels of the metabolite in each cellline
+    metabolite_levels = registry.get("cellline_levels", dataset).row(metabolite_id_value)
+    celllines = metabolite_levels.index
+
+#Get the celllines in our dataset which have mutations in gene of interest, labelled " -" for the others
+    celllines_with_gene_of_interest = mutations_by_gene_label(mutation_gene, dataset)
+    mutation_labels = celllines_with_gene_of_interest.reindex(celllines).fillna(" -").to_numpy()
+
+    plotting_dataframe = pd.DataFrame({metabolite_id_value: metabolite_levels.to_numpy(), "Mutation": mutation_labels,
+                                       "ID": celllines.to_numpy()})
 ## Get the name of the metabolite
     metabolite_name = metaboname(metabolite_id_value, dataset)
     swarmplot = px.strip(plotting_dataframe[metabolite_id_value], color = plotting_dataframe["Mutation"],
@@ -365,7 +454,3 @@ def swarmplot_per_metabolite_permutation(metabolite_id_value, mutation_gene, dat
                                      template="simple_white",
                                      title = "Expression of " + metabolite_name + " in comparison to mutations in " + mutation_gene)
     return(swarmplot)
-
-
-if __name__ == '__main__':
-    app.run_server(debug=True)
@@ -1,113 +1,110 @@
-from dash import Dash, html, dcc, Output, Input
-import dash, dash_table
-from dash.exceptions import PreventUpdate
+from dash import html, dcc
 import plotly.express as px
-import pandas as pd
-
-import matplotlib.pyplot as plt
 import numpy as np
-import matplotlib
-import seaborn as sns
 
-app = Dash(__name__)
+from utils.registry import registry
+from utils.rankings import Rankings, ranking_frame
+from utils.artifacts import artifacts, DEFAULTS
+from utils import bundles
+
+## Data is loaded on first use through the registry (see utils/registry.py):
+##   registry.get("drug_sensitivity", dataset)  - pathway/drug sensitivity, pathways x drugs
 
-## Read in data
-drugsensitivity_shorthouse = pd.read_csv("./Data/Pathway_direction_pvalue_shorthouse.csv", index_col = "Pathway")
-drugsensitivity_cherkaoui = pd.read_csv("./Data/Pathway_direction_pvalue_cherkaoui.csv", index_col = "Pathway")
+## Sorted rows/columns of the drug sensitivities for the ranking plots
+@registry.builder("drug_sensitivity_rankings")
+def drug_sensitivity_rankings(dataset):
+    return Rankings(registry.get("drug_sensitivity", dataset))
 
 ### ----------------------
 # Layout
-layout = html.Div(children=[
-    html.Br() ,
-    html.H1(children='Relationship between Metabolic Pathways and Drug Sensitivity'),
-
-    html.Div(children='''
-        Here you can explore the relationships between metabolic pathways and drug sensitivity.
-        A positive value indicates that activity of the pathway is associated with an increased resistance to a drug.
-        Use dropdown menus to explore specific pathways and drugs.
-    '''),
-    html.Br(),
-    html.Div(children='''
-        This data has been normalised in two differing ways - please see the relevant publications for details, but toggle between them below - default is Shorthouse et al.
-        ''',style={'textAlign': 'center'}),
-
-    dcc.RadioItems(
-    options=[
-       {'label': 'Shorthouse et al  ', 'value': 'shorthouse'},
-       {'label': 'Cherkaoui et al', 'value': 'cherkaoui'}], value = 'shorthouse',
-    inline=True, style={'textAlign': 'center'}, inputStyle={"margin-right": "5px", "margin-left": "5px"},
-    id = 'dataset_type'),
-    html.Div([
-
-        # Graph container
-        html.Div([
-    ## Dropdown for pathways
-            dcc.Dropdown(id="pathway2"
-                 , value="Citric Acid Cycle"
-                 , searchable=True
-                 , placeholder="Choose pathway..."
-                 , clearable=True),
-                 ## Pathway ranking graph
-            dcc.Graph(id="drug_sensitivity_by_pathway"),
-            ],style={'width': '49%', 'display': 'inline-block', 'padding': 10}),
 
+## Callback outputs for the default selections, embedded in the layout (see utils/artifacts.py)
+def default_outputs(defaults):
+    dataset = defaults["dataset"]
+    return {
+        "pathway2": {"options": set_dropdown_options_page3_1(dataset)},
+        "drug": {"options": set_dropdown_options_page3_2(dataset)},
+        "drug_sensitivity_by_pathway": {"figure": drug_sensitivity_by_pathway_plot(defaults["pathway"], dataset)},
+        "pathway_ranking_by_drug": {"figure": pathway_ranking_by_drug_plot(defaults["drug"], dataset)},
+    }
+
+## Built when the page is opened, with the default outputs embedded
+def layout():
+    defaults = artifacts.get("page3", default_outputs)
+
+    return html.Div(children=[
+        html.Br() ,
+        html.H1(children='Relationship between Metabolic Pathways and Drug Sensitivity'),
+
+        html.Div(children='''
+            Here you can explore the relationships between metabolic pathways and drug sensitivity.
+            A positive value indicates that activity of the pathway is associated with an increased resistance to a drug.
+            Use dropdown menus to explore specific pathways and drugs.
+        '''),
+        html.Br(),
+        html.Div(children='''
+            This data has been normalised in two differing ways - please see the relevant publications for details, but toggle between them below - default is Shorthouse et al.
+            ''',style={'textAlign': 'center'}),
+
+        dcc.RadioItems(
+        options=[
+           {'label': 'Shorthouse et al  ', 'value': 'shorthouse'},
+           {'label': 'Cherkaoui et al', 'value': 'cherkaoui'}], value = DEFAULTS["dataset"],
+        inline=True, style={'textAlign': 'center'}, inputStyle={"margin-right": "5px", "margin-left": "5px"},
+        id = 'dataset_type'),
+        ## Data of the ranking plots, drawn in the browser (see utils/bundles.py),
+        ## loaded on the first change of a selection, and the dataset it was loaded for
+        dcc.Store(id = 'page3_bundle'),
+        dcc.Store(id = 'page3_bundle_dataset'),
+        dcc.Store(id = 'page3_bundle_request'),
         html.Div([
-            ## Dropdown for TFs
-            dcc.Dropdown(id="drug"
-                 , value="Cisplatin"
-                 , searchable=True
-                 , placeholder="Choose Drug..."
-                 , clearable=True),
-    ## TF ranking graph
-    dcc.Graph(id="pathway_ranking_by_drug"),
-    ],style={'width': '52%', 'display': 'inline-block', 'padding': 10})
-    ], style={'display': 'flex'}),
-])
+
+            # Graph container
+            html.Div([
+        ## Dropdown for pathways
+                dcc.Dropdown(id="pathway2"
+                     , value=DEFAULTS["pathway"]
+                     , options=defaults["pathway2"]["options"]
+                     , searchable=True
+                     , placeholder="Choose pathway..."
+                     , clearable=True),
+                     ## Pathway ranking graph
+                dcc.Graph(id="drug_sensitivity_by_pathway", **defaults["drug_sensitivity_by_pathway"]),
+                ],style={'width': '49%', 'display': 'inline-block', 'padding': 10}),
+
+            html.Div([
+                ## Dropdown for TFs
+                dcc.Dropdown(id="drug"
+                     , value=DEFAULTS["drug"]
+                     , options=defaults["drug"]["options"]
+                     , searchable=True
+                     , placeholder="Choose Drug..."
+                     , clearable=True),
+        ## TF ranking graph
+        dcc.Graph(id="pathway_ranking_by_drug", **defaults["pathway_ranking_by_drug"]),
+        ],style={'width': '52%', 'display': 'inline-block', 'padding': 10})
+        ], style={'display': 'flex'}),
+    ])
 
 #-------------------------------------------
-## Callbacks
+## Data and figure functions, registered as callbacks in main.py
 
 ## Callback for Dropdown for pathway
-@app.callback(
-    Output(component_id = "pathway", component_property = "options"),
-    [Input(component_id = "dataset_type", component_property = "value")]
-)
 def set_dropdown_options_page3_1(dataset):
-    if dataset == "shorthouse":
-        pathway_dropdown = [{'label': i, 'value': i} for i in drugsensitivity_shorthouse.index.tolist()[1:]]
-    elif dataset == "cherkaoui":
-        pathway_dropdown = [{'label': i, 'value': i} for i in drugsensitivity_cherkaoui.index.tolist()[1:]]
+    drugsensitivity = registry.get("drug_sensitivity", dataset)
+    pathway_dropdown = [{'label': i, 'value': i} for i in drugsensitivity.index.tolist()[1:]]
     return pathway_dropdown
 
-@app.callback(
-    Output(component_id = "drug", component_property = "options"),
-    [Input(component_id = "dataset_type", component_property = "value")]
-)
 def set_dropdown_options_page3_2(dataset):
-    if dataset == "shorthouse":
-        drug_dropdown = [{'label': i, 'value': i} for i in drugsensitivity_shorthouse.columns]
-    elif dataset == "cherkaoui":
-        drug_dropdown = [{'label': i, 'value': i} for i in drugsensitivity_cherkaoui.columns]
+    drugsensitivity = registry.get("drug_sensitivity", dataset)
+    drug_dropdown = [{'label': i, 'value': i} for i in drugsensitivity.columns]
     return drug_dropdown
 
 
 ## Callback for mutation rankings per metabolite
-@app.callback(
-    Output(component_id = "drug_sensitivity_by_pathway", component_property = "figure"),
-    [Input(component_id = "pathway", component_property = "value"),
-    Input(component_id = "dataset_type", component_property = "value")]
-)
-
 def drug_sensitivity_by_pathway_plot(pathway_name, dataset):
-    if dataset == "shorthouse":
-        pathway_dataframe = drugsensitivity_shorthouse
-    elif dataset == "cherkaoui":
-        pathway_dataframe = drugsensitivity_cherkaoui
-    pathway = pd.DataFrame(pathway_dataframe.loc[pathway_name].sort_values())
-    pathway.columns = ["log10(Pvalue) * correlation direction"]
-    pathway["Drug"] = pathway.index
-    pathway = pathway.reset_index()
-    pathway["Drug Rank"] = pathway.index+1
+    drugs, scores = registry.get("drug_sensitivity_rankings", dataset).sorted_row(pathway_name)
+    pathway = ranking_frame(drugs, scores, "Drug Rank", "log10(Pvalue) * correlation direction", "Drug")
 
     pathway["Association"] = np.where((pathway["log10(Pvalue) * correlation direction"] >= 0), "Resistance",
                                                  "Sensitivity")
@@ -118,22 +115,9 @@ def drug_sensitivity_by_pathway_plot(pathway_name, dataset):
     return scatterplot
 
 
-@app.callback(
-    Output(component_id = "pathway_ranking_by_drug", component_property = "figure"),
-    [Input(component_id = "drug", component_property = "value"),
-    Input(component_id = "dataset_type", component_property = "value")]
-)
-
 def pathway_ranking_by_drug_plot(drug_name, dataset):
-    if dataset == "shorthouse":
-        pathway_dataframe = drugsensitivity_shorthouse.T
-    elif dataset == "cherkaoui":
-        pathway_dataframe = drugsensitivity_cherkaoui.T
-    pathway = pd.DataFrame(pathway_dataframe.loc[drug_name].sort_values())
-    pathway.columns = ["log10(Pvalue) * correlation direction"]
-    pathway["SMPDB Pathway"] = pathway.index
-    pathway = pathway.reset_index()
-    pathway["Pathway Rank"] = pathway.index+1
+    pathways, scores = registry.get("drug_sensitivity_rankings", dataset).sorted_column(drug_name)
+    pathway = ranking_frame(pathways, scores, "Pathway Rank", "log10(Pvalue) * correlation direction", "SMPDB Pathway")
 
     pathway["Association"] = np.where((pathway["log10(Pvalue) * correlation direction"] >= 0), "Resistance",
                                                  "Sensitivity")
@@ -143,5 +127,6 @@ def pathway_ranking_by_drug_plot(drug_name, dataset):
                              color = "Association", color_discrete_sequence = ["blue", "red"])
     return scatterplot
 
-if __name__ == '__main__':
-    app.run_server(debug=True, port = 8052)
+## Callback for the data of the ranking plots drawn in the browser (assets/rankings.js)
+def clientside_bundle(dataset):
+    return bundles.bundle(dataset, drug_sensitivity = bundles.ranking_matrix(registry.get("drug_sensitivity_rankings", dataset)))
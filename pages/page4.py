@@ -0,0 +1,184 @@
+from dash import html, dcc, dash_table
+
+from utils.registry import registry
+from utils.associations import AssociationIndex, MAX_RESULTS
+from utils.artifacts import artifacts, DEFAULTS
+from utils.search import SearchIndex
+from pages.page1 import metaboname
+
+## Data is loaded on first use through the registry (see utils/registry.py):
+##   registry.get("tstats", dataset)            - T-statistics, ions x genes
+##   registry.get("tf_correlations", dataset)   - TF/pathway correlations, pathways x TFs
+##   registry.get("drug_sensitivity", dataset)  - pathway/drug sensitivity, pathways x drugs
+
+## Result matrices that can be queried: source table, sign the pages show it with, and the
+## names of its rows, columns and values in the results table
+ASSOCIATION_MATRICES = {
+    "mutations": {"label": "Mutations and metabolites  ", "table": "tstats", "sign": 1,
+                  "rows": "Metabolite", "columns": "Gene", "values": "T-Statistic"},
+    "tfs": {"label": "Transcription factors and pathways  ", "table": "tf_correlations", "sign": -1,
+            "rows": "Pathway", "columns": "Transcription Factor", "values": "-log10(Pvalue)"},
+    "drugs": {"label": "Drugs and pathways", "table": "drug_sensitivity", "sign": 1,
+              "rows": "SMPDB Pathway", "columns": "Drug", "values": "log10(Pvalue) * correlation direction"},
+}
+
+DATASET_LABELS = {"shorthouse": "Shorthouse et al", "cherkaoui": "Cherkaoui et al"}
+
+## Default query of the page
+DEFAULT_QUERY = {"matrix": "mutations", "top_k": 100, "absolute": ["absolute"]}
+
+## Flattened, sorted values of each matrix for top-k and threshold queries (see utils/associations.py)
+def association_index(matrix, dataset):
+    spec = ASSOCIATION_MATRICES[matrix]
+    data = registry.get(spec["table"], dataset)
+    return AssociationIndex(data.to_numpy(), data.index, data.columns, spec["sign"])
+
+@registry.builder("mutations_associations")
+def mutations_associations(dataset):
+    return association_index("mutations", dataset)
+
+@registry.builder("tfs_associations")
+def tfs_associations(dataset):
+    return association_index("tfs", dataset)
+
+@registry.builder("drugs_associations")
+def drugs_associations(dataset):
+    return association_index("drugs", dataset)
+
+## Typeahead indexes of the rows and columns of each matrix, keyed by (matrix, "rows"/"columns");
+## the metabolites are found as on page 1
+@registry.builder("association_search")
+def association_search(dataset):
+    searches = {}
+    for matrix, spec in ASSOCIATION_MATRICES.items():
+        data = registry.get(spec["table"], dataset)
+        for axis, labels in (("rows", data.index), ("columns", data.columns)):
+            searches[matrix, axis] = SearchIndex([{"label": str(i), "value": i} for i in labels], [[i] for i in labels])
+    searches["mutations", "rows"] = registry.get("metabolite_search", dataset)
+    return searches
+
+### ----------------------
+# Layout
+
+## Callback outputs for the default selections, embedded in the layout (see utils/artifacts.py)
+def default_outputs(defaults):
+    data, columns, summary = query_associations(DEFAULT_QUERY["matrix"], [defaults["dataset"]], DEFAULT_QUERY["top_k"],
+                                                None, None, DEFAULT_QUERY["absolute"], [], [])
+    return {
+        "association_table": {"data": data, "columns": columns},
+        "association_summary": {"children": summary},
+    }
+
+## Built when the page is opened, with the default outputs embedded
+def layout():
+    defaults = artifacts.get("page4", default_outputs)
+
+    return html.Div(children=[
+        html.Br() ,
+        html.H1(children='Strongest Associations', style={'textAlign': 'center'}),
+
+        html.Div(children='''
+            Here you can search every mutation/metabolite, transcription factor/pathway and drug/pathway association at once.
+            Ask for the strongest associations, for every association within a range of values, or both, optionally
+            restricted to some metabolites, pathways, genes, transcription factors or drugs. Click a column header to sort the results.
+        ''', style={'textAlign': 'center'}),
+        html.Br(),
+
+        dcc.RadioItems(
+            options = [{"label": spec["label"], "value": matrix} for matrix, spec in ASSOCIATION_MATRICES.items()],
+            value = DEFAULT_QUERY["matrix"], id = 'association_matrix',
+            inline=True, style={'textAlign': 'center'}, inputStyle={"margin-right": "5px", "margin-left": "5px"}),
+        dcc.Checklist(
+            options = [{"label": label + "  ", "value": dataset} for dataset, label in DATASET_LABELS.items()],
+            value = [DEFAULTS["dataset"]], id = 'association_datasets',
+            inline=True, style={'textAlign': 'center'}, inputStyle={"margin-right": "5px", "margin-left": "5px"}),
+        html.Br(),
+
+        html.Div([
+            html.Div([
+                html.Label("Strongest"),
+                dcc.Input(id = "association_top_k", type = "number", min = 1, max = MAX_RESULTS, step = 1,
+                          value = DEFAULT_QUERY["top_k"], placeholder = "all", debounce = True),
+            ], style={'padding': 10}),
+            html.Div([
+                html.Label("Values from"),
+                dcc.Input(id = "association_minimum", type = "number", placeholder = "any", debounce = True),
+            ], style={'padding': 10}),
+            html.Div([
+                html.Label("to"),
+                dcc.Input(id = "association_maximum", type = "number", placeholder = "any", debounce = True),
+            ], style={'padding': 10}),
+            html.Div([
+                dcc.Checklist(options = [{"label": "Absolute values", "value": "absolute"}], value = DEFAULT_QUERY["absolute"],
+                              id = "association_absolute", inputStyle={"margin-right": "5px"}),
+            ], style={'padding': 10, 'paddingTop': 30}),
+        ], style={'display': 'flex', 'justifyContent': 'center'}),
+
+        html.Div([
+            html.Div([
+                ## Rows to search (metabolites or pathways), loaded as the user types
+                dcc.Dropdown(id = "association_rows", multi = True, options = [], value = [],
+                             placeholder = "All metabolites / pathways..."),
+            ], style={'width': '49%', 'display': 'inline-block', 'padding': 10}),
+            html.Div([
+                ## Columns to search (genes, transcription factors or drugs)
+                dcc.Dropdown(id = "association_columns", multi = True, options = [], value = [],
+                             placeholder = "All genes / transcription factors / drugs..."),
+            ], style={'width': '49%', 'display': 'inline-block', 'padding': 10}),
+        ], style={'display': 'flex'}),
+
+        html.Div(id = "association_summary", style={'textAlign': 'center', 'padding': 10},
+                 **defaults["association_summary"]),
+
+        ## Results, sorted in the browser
+        dash_table.DataTable(
+            id = "association_table",
+            style_cell={'textAlign':'center','font_size': '12px','whiteSpace':'normal','height':'auto'},
+            sort_action = "native",
+            sort_mode = "single",
+            page_action = "native",
+            page_size = 25,
+            **defaults["association_table"]
+        ),
+    ])
+
+#-------------------------------------------
+## Data functions, registered as callbacks in main.py
+
+## Callback for the results table: the strongest associations (largest |value| if absolute) within
+## the range of values, in the selected rows and columns of each selected dataset
+def query_associations(matrix, datasets, top_k, minimum, maximum, absolute, rows, columns):
+    spec = ASSOCIATION_MATRICES[matrix]
+    absolute = "absolute" in (absolute or [])
+    limit = min(top_k or MAX_RESULTS, MAX_RESULTS)
+
+    records = []
+    total = 0
+    for dataset in datasets or []:
+        index = registry.get(f"{matrix}_associations", dataset)
+        positions, matches = index.query(top_k, minimum, maximum, absolute, rows or None, columns or None)
+        frame = index.labelled(positions, spec["rows"], spec["columns"], spec["values"])
+        if matrix == "mutations":
+            frame[spec["rows"]] = [metaboname(i, dataset) for i in frame[spec["rows"]].tolist()]
+        frame.insert(0, "Dataset", DATASET_LABELS[dataset])
+        records += frame.to_dict("records")
+        total += matches
+
+    ## Strongest of the datasets' results (each already strongest first; ties keep dataset order)
+    strength = (lambda record: abs(record[spec["values"]])) if absolute else (lambda record: record[spec["values"]])
+    records = sorted(records, key = strength, reverse = True)[:limit]
+    for rank, record in enumerate(records, start = 1):
+        record["Rank"] = rank
+
+    table_columns = [{"name": name, "id": name, "type": "numeric" if name in ("Rank", spec["values"]) else "text"}
+                     for name in ["Rank", "Dataset", spec["rows"], spec["columns"], spec["values"]]]
+    summary = f"{total} associations match, showing the {len(records)} strongest"
+    return records, table_columns, summary
+
+## Callback for the row or column filter options matching the typed search (plus the selected values)
+def association_options(matrix, axis, datasets, search_value, value):
+    options = {}
+    for dataset in datasets or []:
+        for option in registry.get("association_search", dataset)[matrix, axis].dropdown_options(search_value, value):
+            options.setdefault(option["value"], option)
+    return list(options.values())
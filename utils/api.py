@@ -0,0 +1,248 @@
+# Bulk query HTTP API, streamed as NDJSON
+#
+# Pipelines read the numbers behind the figures from routes on the Flask server:
+#     /api/v1/<dataset>/associations  strongest associations or a range of values (as the Associations page)
+#     /api/v1/<dataset>/rankings      rankings of metabolites, genes, pathways, TFs or drugs (as the ranking plots)
+#     /api/v1/<dataset>/levels        log10 metabolite levels per cell line (as the swarmplot)
+#     /api/v1/<dataset>/drug-pathway  drug/pathway association values
+# Each takes batches of ids as repeated or comma separated query parameters
+# (?genes=TP53,KRAS&genes=A1CF) or as lists in a JSON body (POST), and answers with one
+# JSON object per line (application/x-ndjson). The data comes from the registry the pages
+# use; checks run before the response starts, then lines are generated row by row from
+# the loaded matrices and sent in chunks, so no response is held in memory whole. Ids
+# that are not found are reported as {"error": ...} lines at the start.
+
+import functools
+import json
+import os
+
+import flask
+import numpy as np
+
+from utils import datastore
+from utils.associations import MAX_RESULTS
+from utils.registry import registry
+
+## Most ids in one batch parameter of a request (dash_api_max_batch)
+MAX_BATCH = int(os.environ.get("dash_api_max_batch", 1000))
+
+## Approximate size of the chunks a response is sent in
+CHUNK_BYTES = 64 * 1024
+
+NDJSON = "application/x-ndjson"
+
+## Matrices of the API: their ranking structure (registered by the pages), the parameters
+## selecting their rows and columns, and the keys of rows and columns in the output
+MATRICES = {
+    "mutations": {"rankings": "tstats_rankings", "associations": "mutations_associations",
+                  "rows": "metabolites", "columns": "genes", "row": "metabolite", "column": "gene"},
+    "tfs": {"rankings": "tf_rankings", "associations": "tfs_associations",
+            "rows": "pathways", "columns": "tfs", "row": "pathway", "column": "tf"},
+    "drugs": {"rankings": "drug_sensitivity_rankings", "associations": "drugs_associations",
+              "rows": "pathways", "columns": "drugs", "row": "pathway", "column": "drug"},
+}
+
+blueprint = flask.Blueprint("api", __name__, url_prefix = "/api/v1/<dataset>")
+
+
+## JSON value of a label (numpy integer ids as ints)
+def plain(label):
+    return label.item() if isinstance(label, np.generic) else label
+
+
+## JSON value of a matrix value: None for missing values, float32 values at their own precision
+def number(value):
+    if value != value:
+        return None
+    return float(str(value)) if isinstance(value, np.float32) else float(value)
+
+
+## Lines of records, joined into chunks of about CHUNK_BYTES
+def ndjson(records):
+    chunk, size = [], 0
+    for record in records:
+        line = json.dumps(record, separators = (",", ":")) + "\n"
+        chunk.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            yield "".join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield "".join(chunk)
+
+
+def error(status, message):
+    return flask.Response(json.dumps({"error": message}), status = status, mimetype = "application/json")
+
+
+def body():
+    payload = flask.request.get_json(silent = True)
+    return payload if isinstance(payload, dict) else {}
+
+
+## Ids of a batch parameter, from the query string and the JSON body, in request order without repeats
+def batch(name):
+    values = [value.strip() for argument in flask.request.args.getlist(name) for value in argument.split(",")]
+    listed = body().get(name, [])
+    values += listed if isinstance(listed, list) else [listed]
+    values = list(dict.fromkeys(value for value in values if value != ""))
+    if len(values) > MAX_BATCH:
+        raise ValueError(f"At most {MAX_BATCH} {name} per request")
+    return values
+
+
+## Scalar parameter, from the query string or the JSON body, converted with kind (None when absent)
+def parameter(name, kind = str):
+    value = flask.request.args.get(name, body().get(name))
+    if value is None or value == "":
+        return None
+    if kind is bool:
+        return str(value).lower() in ("1", "true", "yes")
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {name}: {value!r}")
+
+
+def matrix_spec():
+    matrix = parameter("matrix") or "mutations"
+    if matrix not in MATRICES:
+        raise ValueError(f"Unknown matrix {matrix!r} (one of {', '.join(MATRICES)})")
+    return MATRICES[matrix]
+
+
+## Positions in an index of requested ids (strings converted to integer ids for an integer index),
+## and error records for the ids not found
+def locate(index, requested, name):
+    keys = []
+    for label in requested:
+        if index.dtype.kind in "iu":
+            try:
+                label = int(label)
+            except (TypeError, ValueError):
+                pass
+        keys.append(label)
+    positions = index.get_indexer(keys) if keys else np.array([], dtype = np.int64)
+    missing = [{"error": f"Unknown {name}", name: label} for label, position in zip(requested, positions) if position < 0]
+    return positions[positions >= 0], missing
+
+
+## Route returning the records of view(dataset), streamed as NDJSON. The view does its checks and
+## loading before returning the records (a generator), so errors are still answered with a status.
+def endpoint(view):
+    @functools.wraps(view)
+    def wrapper(dataset):
+        if dataset not in datastore.DATASETS:
+            return error(404, f"Unknown dataset {dataset!r} (one of {', '.join(datastore.DATASETS)})")
+        try:
+            records = view(dataset)
+        except ValueError as exception:
+            return error(400, str(exception))
+        except OSError as exception:
+            return error(503, f"Data not available: {exception}")
+        return flask.Response(ndjson(records), mimetype = NDJSON)
+    return wrapper
+
+
+## Strongest associations of a matrix, or all within [minimum, maximum] (of |value| if absolute),
+## for the selected rows and columns: top_k, minimum, maximum, absolute, matrix, and id batches
+@blueprint.route("/associations", methods = ["GET", "POST"])
+@endpoint
+def associations(dataset):
+    spec = matrix_spec()
+    index = registry.get(spec["associations"], dataset)
+    top_k = parameter("top_k", int)
+    if top_k is not None and not 1 <= top_k <= MAX_RESULTS:
+        raise ValueError(f"top_k must be between 1 and {MAX_RESULTS}")
+    requested_rows, requested_columns = batch(spec["rows"]), batch(spec["columns"])
+    rows, missing_rows = locate(index.rows, requested_rows, spec["row"])
+    columns, missing_columns = locate(index.columns, requested_columns, spec["column"])
+    ## No ids: every row (column); only unknown ids: none
+    rows = index.rows[rows] if requested_rows else None
+    columns = index.columns[columns] if requested_columns else None
+    positions, total = index.query(top_k, parameter("minimum", float), parameter("maximum", float),
+                                   parameter("absolute", bool), rows, columns)
+
+    def records():
+        yield from missing_rows + missing_columns
+        yield {"matches": total, "returned": len(positions)}
+        values = index.values.ravel()
+        for rank, position in enumerate(positions.tolist(), start = 1):
+            row, column = divmod(position, len(index.columns))
+            yield {"rank": rank, spec["row"]: plain(index.rows[row]), spec["column"]: plain(index.columns[column]),
+                   "value": number(values[position])}
+    return records()
+
+
+## Ranking (ascending, as the ranking plots) of the columns for each requested row, and of the rows
+## for each requested column: matrix, and id batches
+@blueprint.route("/rankings", methods = ["GET", "POST"])
+@endpoint
+def rankings(dataset):
+    spec = matrix_spec()
+    ranked = registry.get(spec["rankings"], dataset)
+    rows, missing_rows = locate(ranked.index, batch(spec["rows"]), spec["row"])
+    columns, missing_columns = locate(ranked.columns, batch(spec["columns"]), spec["column"])
+
+    def records():
+        yield from missing_rows + missing_columns
+        for axis, positions, labels, sort in ((spec["row"], rows, ranked.index, ranked.sorted_row),
+                                               (spec["column"], columns, ranked.columns, ranked.sorted_column)):
+            ranked_name = spec["column"] if axis == spec["row"] else spec["row"]
+            for label in labels[positions]:
+                ranked_labels, values = sort(label)
+                for rank, (ranked_label, value) in enumerate(zip(ranked_labels, values), start = 1):
+                    yield {axis: plain(label), "rank": rank, ranked_name: plain(ranked_label), "value": number(value)}
+    return records()
+
+
+## log10 levels of each requested metabolite (default all) in each cell line (default all): metabolites, cell_lines
+@blueprint.route("/levels", methods = ["GET", "POST"])
+@endpoint
+def levels(dataset):
+    cellline_levels = registry.get("cellline_levels", dataset)
+    requested = batch("metabolites")
+    rows, missing = locate(cellline_levels.index, requested, "metabolite")
+    rows = rows if requested else np.arange(len(cellline_levels.index))
+    cell_lines = batch("cell_lines")
+    columns = np.flatnonzero(cellline_levels.columns.isin(cell_lines)) if cell_lines else np.arange(len(cellline_levels.columns))
+    known = set(cellline_levels.columns)
+    missing += [{"error": "Unknown cell_line", "cell_line": cell_line} for cell_line in cell_lines if cell_line not in known]
+
+    def records():
+        yield from missing
+        for row in rows:
+            metabolite = plain(cellline_levels.index[row])
+            values = cellline_levels.values[row]
+            for column in columns:
+                yield {"metabolite": metabolite, "cell_line": plain(cellline_levels.columns[column]),
+                       "log10_level": number(values[column])}
+    return records()
+
+
+## Drug/pathway association values (log10(P value) * correlation direction) of the requested
+## pathways and drugs (default all): pathways, drugs
+@blueprint.route("/drug-pathway", methods = ["GET", "POST"])
+@endpoint
+def drug_pathway(dataset):
+    drug_sensitivity = registry.get("drug_sensitivity", dataset)
+    requested_pathways, requested_drugs = batch("pathways"), batch("drugs")
+    rows, missing_pathways = locate(drug_sensitivity.index, requested_pathways, "pathway")
+    columns, missing_drugs = locate(drug_sensitivity.columns, requested_drugs, "drug")
+    rows = rows if requested_pathways else np.arange(len(drug_sensitivity.index))
+    columns = columns if requested_drugs else np.arange(len(drug_sensitivity.columns))
+    values = drug_sensitivity.to_numpy()
+
+    def records():
+        yield from missing_pathways + missing_drugs
+        for row in rows:
+            pathway = drug_sensitivity.index[row]
+            for column in columns:
+                yield {"pathway": plain(pathway), "drug": plain(drug_sensitivity.columns[column]),
+                       "value": number(values[row, column])}
+    return records()
+
+
+## Register the API routes (the structures they read are registered by the pages)
+def enable(app):
+    app.server.register_blueprint(blueprint)
@@ -0,0 +1,120 @@
+# Precomputed outputs for the default view of each page
+#
+# Every visitor opening a page sees the same default selections, so the outputs of its
+# callbacks for those selections (figures, dropdown options) are rendered once, written
+# as gzipped JSON, and embedded in the page layout; the callbacks only run when the user
+# changes a selection. The artifacts are built with
+#     python -m utils.artifacts
+# and carry a fingerprint of the input files, of the page module and of the modules
+# shaping its outputs (OUTPUT_MODULES): when any of them changes they are rendered again
+# on the next page view.
+
+import functools
+import gzip
+import hashlib
+import inspect
+import json
+import os
+import threading
+
+from plotly.io.json import to_json_plotly
+
+from utils import associations, bundles, datastore, heatmaps, matrices, rankings, search, tables, tiles
+from utils.figure_cache import data_fingerprint
+from utils.heatmaps import PAYLOAD
+
+## Directory of the rendered page artifacts (dash_artifact_dir)
+ARTIFACT_DIR = os.environ.get("dash_artifact_dir", os.path.join(datastore.STORE_DIR, "artifacts"))
+
+## Modules that shape the outputs of the pages (figures, tables, dropdown options, bundles)
+OUTPUT_MODULES = [associations, bundles, heatmaps, matrices, rankings, search, tables, tiles]
+
+## Default selections of the pages
+DEFAULTS = {
+    "dataset": "shorthouse",
+    "metabolite": 1,
+    "gene": "A1CF",
+    "pathway": "Citric Acid Cycle",
+    "TF": "AR",
+    "drug": "Cisplatin",
+}
+
+
+## Fingerprint of the source file a render function is defined in
+@functools.lru_cache(maxsize = None)
+def source_fingerprint(path):
+    with open(path, "rb") as source_file:
+        return hashlib.sha1(source_file.read()).hexdigest()[:16]
+
+
+## Fingerprint of the modules shaping the outputs
+@functools.lru_cache(maxsize = None)
+def output_modules_fingerprint():
+    sources = "".join(source_fingerprint(inspect.getsourcefile(module)) for module in OUTPUT_MODULES)
+    return hashlib.sha1(sources.encode()).hexdigest()[:16]
+
+
+## Fingerprint of everything the default outputs of a page depend on
+def fingerprint(render):
+    return (f"{data_fingerprint()}-{source_fingerprint(inspect.getsourcefile(render))}-"
+            f"{output_modules_fingerprint()}-{PAYLOAD}")
+
+
+class Artifacts:
+    def __init__(self, directory = ARTIFACT_DIR):
+        self.directory = directory
+        ## page -> (fingerprint, outputs)
+        self.loaded = {}
+        self.lock = threading.Lock()
+
+    def path(self, page):
+        return os.path.join(self.directory, f"{page}.json.gz")
+
+    def read(self, page, current):
+        try:
+            with gzip.open(self.path(page), "rt") as artifact_file:
+                artifact = json.load(artifact_file)
+        except (OSError, ValueError):
+            return None
+        return artifact["outputs"] if artifact.get("fingerprint") == current else None
+
+    ## Render a page's outputs (render(DEFAULTS) -> {component id: {property: value}}) and write them
+    def write(self, page, render, current):
+        payload = to_json_plotly({"fingerprint": current, "outputs": render(DEFAULTS)})
+        try:
+            os.makedirs(self.directory, exist_ok = True)
+            temporary = self.path(page) + f".{os.getpid()}.tmp"
+            with gzip.open(temporary, "wt", compresslevel = 9) as artifact_file:
+                artifact_file.write(payload)
+            os.replace(temporary, self.path(page))
+        except OSError as error:
+            print(f"Could not write the {page} artifact: {error}")
+        return json.loads(payload)["outputs"]
+
+    ## Default outputs of a page, rendered again if missing or built from other data
+    def get(self, page, render):
+        current = fingerprint(render)
+        with self.lock:
+            if page in self.loaded and self.loaded[page][0] == current:
+                return self.loaded[page][1]
+            outputs = self.read(page, current)
+            if outputs is None:
+                outputs = self.write(page, render, current)
+            self.loaded[page] = (current, outputs)
+            return outputs
+
+    ## Render the artifacts of every page
+    def build(self, pages):
+        for page, render in pages.items():
+            self.write(page, render, fingerprint(render))
+            self.loaded.pop(page, None)
+            print(f"Built {self.path(page)}")
+
+
+artifacts = Artifacts()
+
+
+if __name__ == '__main__':
+    from pages import page1, page2, page3, page4
+    artifacts.build({"page1": page1.default_outputs, "page2": page2.default_outputs, "page3": page3.default_outputs,
+                     "page4": page4.default_outputs})
@@ -0,0 +1,109 @@
+# Top-k and threshold queries over a result matrix
+#
+# AssociationIndex answers "the k strongest associations" and "every association in a
+# value range" for a whole matrix (e.g. genes x ions), optionally restricted to some rows
+# and columns. Its values are flattened once and sorted (missing values dropped), so a
+# threshold query is a searchsorted range of the sorted values and the strongest
+# associations of any range sit at its ends. Only a few candidates from those ends (or
+# the cells of the selected rows/columns) are ranked per query, with argpartition, so
+# queries take milliseconds however large the matrix is.
+
+import numpy as np
+import pandas as pd
+
+from utils.rankings import position_dtype
+
+## Most associations returned by one query
+MAX_RESULTS = 10000
+
+
+class AssociationIndex:
+    ## values: rows x columns matrix, shown multiplied by sign
+    def __init__(self, values, rows, columns, sign = 1):
+        self.values = np.asarray(values, dtype = np.float32) * np.float32(sign)
+        self.rows = pd.Index(rows)
+        self.columns = pd.Index(columns)
+        flat = self.values.ravel()
+        order = np.argsort(flat, kind = "stable")
+        ## argsort puts NaNs last
+        present = np.count_nonzero(~np.isnan(flat))
+        self.order = order[:present].astype(position_dtype(flat.size))
+        self.sorted_values = flat[self.order]
+
+    def __len__(self):
+        return len(self.sorted_values)
+
+    ## Slice of the sorted index with low <= value <= high (either bound may be None).
+    ## The bounds are rounded inwards to float32: a float64 bound would make searchsorted
+    ## convert the whole sorted array.
+    def value_range(self, low, high):
+        start, stop = 0, len(self)
+        if low is not None:
+            bound = np.float32(low)
+            if bound < low:
+                bound = np.nextafter(bound, np.float32(np.inf))
+            start = np.searchsorted(self.sorted_values, bound, side = "left")
+        if high is not None:
+            bound = np.float32(high)
+            if bound > high:
+                bound = np.nextafter(bound, np.float32(-np.inf))
+            stop = np.searchsorted(self.sorted_values, bound, side = "right")
+        return slice(start, max(start, stop))
+
+    ## Flat positions of the cells in the selected rows and columns (labels; None for all)
+    def cells(self, rows, columns):
+        row_positions = np.arange(len(self.rows)) if rows is None else self.rows.get_indexer(rows)
+        column_positions = np.arange(len(self.columns)) if columns is None else self.columns.get_indexer(columns)
+        row_positions = row_positions[row_positions >= 0]
+        column_positions = column_positions[column_positions >= 0]
+        return (row_positions[:, None] * len(self.columns) + column_positions[None, :]).ravel()
+
+    ## Associations with minimum <= value <= maximum (of |value| if absolute) in the selected rows and
+    ## columns, strongest first (largest |value| if absolute, else largest value), at most top_k of them.
+    ## Returns the flat positions of the matches returned and the number of matches.
+    def query(self, top_k = None, minimum = None, maximum = None, absolute = False, rows = None, columns = None):
+        limit = min(top_k or MAX_RESULTS, MAX_RESULTS)
+
+        if rows is not None or columns is not None:
+            positions = self.cells(rows, columns)
+            values = self.values.ravel()[positions]
+            keys = np.abs(values) if absolute else values
+            matches = ~np.isnan(keys)
+            if minimum is not None:
+                matches &= keys >= minimum
+            if maximum is not None:
+                matches &= keys <= maximum
+            positions, keys = positions[matches], keys[matches]
+            total = len(positions)
+        else:
+            ## Ranges of the sorted values, each with its strongest values at one end
+            if absolute:
+                low = 0 if minimum is None else max(minimum, 0)
+                ranges = [(self.value_range(low, maximum), "top"),
+                          (self.value_range(None if maximum is None else -maximum, -low), "bottom")]
+                if low == 0:
+                    ## Zeros fall in both ranges; count them once
+                    zeros = self.value_range(0, 0)
+                    ranges[1] = (slice(ranges[1][0].start, zeros.start), "bottom")
+            else:
+                ranges = [(self.value_range(minimum, maximum), "top")]
+            total = sum(selected.stop - selected.start for selected, _ in ranges)
+            ## Only the limit strongest values of each range can be among the results
+            candidates = [np.arange(max(selected.start, selected.stop - limit), selected.stop) if end == "top"
+                          else np.arange(selected.start, min(selected.stop, selected.start + limit))
+                          for selected, end in ranges]
+            candidates = np.concatenate(candidates)
+            positions = self.order[candidates].astype(np.int64)
+            keys = np.abs(self.sorted_values[candidates]) if absolute else self.sorted_values[candidates]
+
+        if len(positions) > limit:
+            strongest = np.argpartition(-keys, limit - 1)[:limit]
+            positions, keys = positions[strongest], keys[strongest]
+        ranking = np.lexsort((positions, -keys))
+        return positions[ranking], int(total)
+
+    ## Rows, columns and values of flat positions, as plotting/table columns
+    def labelled(self, positions, row_name, column_name, value_name):
+        row_positions, column_positions = np.divmod(positions, len(self.columns))
+        return pd.DataFrame({row_name: self.rows[row_positions], column_name: self.columns[column_positions],
+                             value_name: self.values.ravel()[positions].astype(np.float64).round(4)})
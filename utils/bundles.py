@@ -0,0 +1,34 @@
+# Typed-array bundles for the plots drawn in the browser
+#
+# The ranking and volcano plots only slice, sort and colour one row or column of a
+# matrix, so each page sends its matrices once per dataset (into a dcc.Store) and
+# assets/rankings.js builds those figures in clientside callbacks. Arrays travel as
+# base64 little-endian typed arrays (float32 values), decoded once in the browser;
+# the bundle response is compressed and validated like any callback response
+# (see utils/responses.py).
+
+import base64
+
+import numpy as np
+import plotly.io as pio
+
+## Template of the figures drawn in the browser, as for the server-side figures
+TEMPLATE = "simple_white"
+
+
+## Array as {"dtype", "shape", "data": base64 bytes} for a JavaScript typed array
+def typed_array(values, dtype = "<f4"):
+    values = np.ascontiguousarray(values, dtype = dtype)
+    return {"dtype": values.dtype.name, "shape": list(values.shape), "data": base64.b64encode(values.tobytes()).decode()}
+
+
+## Stored values, labels and sign of a Rankings matrix; the browser sorts rows and
+## columns as Rankings.sorted_row/sorted_column do
+def ranking_matrix(rankings):
+    return {"rows": rankings.index.tolist(), "columns": rankings.columns.tolist(), "sign": rankings.sign,
+            "values": typed_array(rankings.values)}
+
+
+## Bundle of a page for a dataset: its arrays plus the figure template
+def bundle(dataset, **arrays):
+    return dict(arrays, dataset = dataset, template = pio.templates[TEMPLATE].to_plotly_json())
@@ -0,0 +1,169 @@
+# Hierarchical clustering orders for the heatmap matrices
+#
+# The heatmaps can show their rows and columns in file order or clustered, with related
+# metabolites, genes and pathways next to each other. The clustering is computed offline
+# for every matrix in CLUSTERED_TABLES and dataset with
+#     python -m utils.clustering [--dendrogram]
+# and stored next to the data store (./Data/store/clustering), with the signature of the
+# source CSV: an order computed from other data is not used. Requests only read the
+# stored leaf orders, once per process through the registry; no clustering happens while
+# serving.
+#
+# Rows (and columns) are compared by correlation distance (1 - Pearson r, missing values
+# as 0) and joined by average linkage. The distances are computed in blocks of rows with
+# one matrix product per block, so beyond the condensed distance vector scipy's linkage
+# needs, memory stays at a block of CHUNK_ROWS x rows.
+
+import argparse
+import json
+import logging
+import os
+import shutil
+
+import numpy as np
+from scipy.cluster.hierarchy import leaves_list, linkage
+
+from utils import datastore
+from utils.registry import registry
+
+## Directory of the stored row and column orders (dash_clustering_dir)
+CLUSTERING_DIR = os.environ.get("dash_clustering_dir", os.path.join(datastore.STORE_DIR, "clustering"))
+
+## Matrices shown as heatmaps
+CLUSTERED_TABLES = ["tstats", "progeny"]
+
+## Rows per block of the distance computation
+CHUNK_ROWS = 1024
+
+LINKAGE_METHOD = "average"
+
+## Orderings offered for the heatmaps
+ORDERING_OPTIONS = [{"label": "File order  ", "value": "file"}, {"label": "Clustered", "value": "clustered"}]
+
+logger = logging.getLogger(__name__)
+
+## (table, dataset) pairs already reported as having no clustering
+missing_reported = set()
+
+
+## Condensed correlation distances between the rows of values (as scipy's pdist(values, "correlation"),
+## with missing values as 0 and constant rows at distance 1 from every other row)
+def correlation_distances(values, chunk_rows = CHUNK_ROWS):
+    centred = np.nan_to_num(np.asarray(values, dtype = np.float64))
+    centred = centred - centred.mean(axis = 1, keepdims = True)
+    norms = np.linalg.norm(centred, axis = 1)
+    norms[norms == 0] = 1
+    centred /= norms[:, None]
+
+    rows = len(centred)
+    distances = np.empty(rows * (rows - 1) // 2)
+    for start in range(0, rows, chunk_rows):
+        stop = min(start + chunk_rows, rows)
+        ## Distances of this block of rows to themselves and every later row
+        block = np.clip(1 - centred[start:stop] @ centred[start:].T, 0, 2)
+        for row in range(start, stop):
+            ## Condensed position of the pair (row, row + 1)
+            offset = rows * row - row * (row + 1) // 2
+            distances[offset:offset + rows - row - 1] = block[row - start, row - start + 1:]
+    return distances
+
+
+## Average linkage of the rows of values and its leaf order
+def cluster_rows(values, chunk_rows = CHUNK_ROWS):
+    if len(values) < 2:
+        return np.zeros((0, 4)), np.arange(len(values))
+    tree = linkage(correlation_distances(values, chunk_rows), method = LINKAGE_METHOD)
+    return tree, leaves_list(tree)
+
+
+def directory_for(table, dataset):
+    return os.path.join(CLUSTERING_DIR, datastore.table_key(table, dataset))
+
+
+## Cluster the rows and columns of a table and store their leaf orders (and linkages, for a dendrogram)
+def build_table(table, dataset, dendrogram = False, chunk_rows = CHUNK_ROWS):
+    values = datastore.load(table, dataset).to_numpy()
+    directory = directory_for(table, dataset)
+    building = directory + ".building"
+    shutil.rmtree(building, ignore_errors = True)
+    os.makedirs(building)
+
+    for axis, axis_values in (("rows", values), ("columns", values.T)):
+        tree, order = cluster_rows(axis_values, chunk_rows)
+        datastore.save_array(building, f"{axis}_order", order)
+        if dendrogram:
+            datastore.save_array(building, f"{axis}_linkage", tree)
+    with open(os.path.join(building, "meta.json"), "w") as meta_file:
+        json.dump({"source": datastore.source_signature(table, dataset), "method": LINKAGE_METHOD,
+                   "dendrogram": dendrogram}, meta_file)
+
+    shutil.rmtree(directory, ignore_errors = True)
+    os.rename(building, directory)
+
+
+## Stored clustering of a table: {"rows", "columns"} leaf orders, plus "rows_linkage" and
+## "columns_linkage" if built with a dendrogram. None when missing or built from other data.
+def load(table, dataset):
+    directory = directory_for(table, dataset)
+    try:
+        with open(os.path.join(directory, "meta.json")) as meta_file:
+            meta = json.load(meta_file)
+        if meta["source"] != datastore.source_signature(table, dataset):
+            return None
+        clustering = {axis: datastore.load_array(directory, f"{axis}_order") for axis in ("rows", "columns")}
+        if meta["dendrogram"]:
+            for axis in ("rows", "columns"):
+                clustering[f"{axis}_linkage"] = datastore.load_array(directory, f"{axis}_linkage")
+    except OSError:
+        return None
+    return clustering
+
+
+## Stored clusterings of the heatmap matrices, read once per process
+@registry.builder("tstats_clustering")
+def tstats_clustering(dataset):
+    return load("tstats", dataset)
+
+@registry.builder("progeny_clustering")
+def progeny_clustering(dataset):
+    return load("progeny", dataset)
+
+
+## Stored row and column orders of a table (of the given shape), or None while they are
+## not built for the current data (reported once per table and dataset)
+def stored_orders(table, dataset, shape):
+    clustering = registry.get(f"{table}_clustering", dataset)
+    if clustering is None or len(clustering["rows"]) != shape[0] or len(clustering["columns"]) != shape[1]:
+        if (table, dataset) not in missing_reported:
+            missing_reported.add((table, dataset))
+            logger.warning("No clustering stored for %s, showing file order", datastore.table_key(table, dataset))
+        return None
+    return clustering["rows"], clustering["columns"]
+
+
+## Row and column positions of a table (of the given shape) for a heatmap ordering:
+## file order, or the stored clustering (file order while it is not built for the current data)
+def heatmap_orders(table, dataset, shape, ordering):
+    orders = stored_orders(table, dataset, shape) if ordering == "clustered" else None
+    if orders is None:
+        return np.arange(shape[0]), np.arange(shape[1])
+    return orders
+
+
+## Cluster every available heatmap matrix
+def build(dendrogram = False, chunk_rows = CHUNK_ROWS):
+    for table in CLUSTERED_TABLES:
+        for dataset in datastore.DATASETS:
+            if not os.path.exists(datastore.source_path(table, dataset)):
+                print(f"Skipping {datastore.table_key(table, dataset)}: {datastore.source_path(table, dataset)} not found")
+                continue
+            build_table(table, dataset, dendrogram, chunk_rows)
+            print(f"Clustered {datastore.table_key(table, dataset)}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dendrogram", action = "store_true", help = "also store the linkage matrices, to draw dendrograms")
+    parser.add_argument("--chunk-rows", type = int, default = CHUNK_ROWS)
+    arguments = parser.parse_args()
+    build(arguments.dendrogram, arguments.chunk_rows)
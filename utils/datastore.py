@@ -0,0 +1,185 @@
+# Binary store for the dashboard input tables
+#
+# Every table the pages read from ./Data is parsed from CSV, transformed (column
+# renames, sign flips, dropped columns) and written once as typed .npy columns by
+#     python -m utils.datastore
+# The pages then load tables through load(), which reads the built store and falls
+# back to parsing the CSV when the store is missing or older than the CSV.
+#
+# Numeric matrices are opened read-only with mmap, so every worker process maps the
+# same page-cache copy of the data instead of holding a private one.
+
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+DATA_DIR = os.environ.get("dash_data_dir", "./Data")
+STORE_DIR = os.environ.get("dash_store_dir", os.path.join(DATA_DIR, "store"))
+STORE_MMAP = os.environ.get("dash_store_mmap", "True") == "True"
+
+DATASETS = ["shorthouse", "cherkaoui"]
+
+
+## Remove start of name from column names (e.g. Score_AR -> AR)
+def strip_column_prefix(dataframe):
+    dataframe.columns = [item.split("_")[1] for item in dataframe.columns]
+    return dataframe
+
+#-------------------------------------
+# CSV readers, with the transforms applied by the pages
+
+def read_tstats(dataset):
+    return pd.read_csv(f"{DATA_DIR}/Mutation_metabolite_associations_ordered_{dataset}.csv", index_col = "Unnamed: 0")
+
+def read_metabolite_lookup(dataset):
+    metabolite_lookup = pd.read_csv(f"{DATA_DIR}/Metabolite_reference_table_{dataset}.csv")
+    return metabolite_lookup[["ionIdx","id", "score", "name"]]
+
+def read_metabolite_levels(dataset):
+    metabolite_levels = pd.read_csv(f"{DATA_DIR}/Metabolite_levels_{dataset}.csv", index_col = "ionIdx")
+    return metabolite_levels.drop("ionMz", axis =1)
+
+def read_diff_expr(dataset):
+    return pd.read_csv(f"{DATA_DIR}/Mutation_differential_expression_{dataset}.csv", index_col = "ionIdx")
+
+def read_cellline_mutations(dataset = None):
+    return pd.read_csv(f"{DATA_DIR}/Mutations_in_celllines.csv")
+
+def read_cellline_mapping(dataset):
+    return pd.read_csv(f"{DATA_DIR}/Cellline_mappings_{dataset}.csv")
+
+def read_progeny(dataset):
+    metabolomics_TF_correlations = pd.read_csv(f"{DATA_DIR}/Progeny_correlations_{dataset}.csv", index_col = "Pathway")
+    return strip_column_prefix(-metabolomics_TF_correlations)
+
+def read_tf_correlations(dataset):
+    TF_correlations = pd.read_csv(f"{DATA_DIR}/TF_pathway_correlations_{dataset}.csv", index_col = "Pathway")
+    return strip_column_prefix(TF_correlations)
+
+def read_drug_sensitivity(dataset):
+    return pd.read_csv(f"{DATA_DIR}/Pathway_direction_pvalue_{dataset}.csv", index_col = "Pathway")
+
+
+## Table name -> (kind, reader, source file pattern, one copy per dataset)
+## "matrix" tables are fully numeric with a labelled index, "frame" tables are mixed-type with a default index
+TABLES = {
+    "tstats": ("matrix", read_tstats, "Mutation_metabolite_associations_ordered_{dataset}.csv", True),
+    "metabolite_lookup": ("frame", read_metabolite_lookup, "Metabolite_reference_table_{dataset}.csv", True),
+    "metabolite_levels": ("matrix", read_metabolite_levels, "Metabolite_levels_{dataset}.csv", True),
+    "diff_expr": ("matrix", read_diff_expr, "Mutation_differential_expression_{dataset}.csv", True),
+    "cellline_mutations": ("frame", read_cellline_mutations, "Mutations_in_celllines.csv", False),
+    "cellline_mapping": ("frame", read_cellline_mapping, "Cellline_mappings_{dataset}.csv", True),
+    "progeny": ("matrix", read_progeny, "Progeny_correlations_{dataset}.csv", True),
+    "tf_correlations": ("matrix", read_tf_correlations, "TF_pathway_correlations_{dataset}.csv", True),
+    "drug_sensitivity": ("matrix", read_drug_sensitivity, "Pathway_direction_pvalue_{dataset}.csv", True),
+}
+
+#-------------------------------------
+# Store layout: one directory per (table, dataset) holding .npy arrays and a meta.json
+
+def table_key(table, dataset = None):
+    per_dataset = TABLES[table][3]
+    return f"{table}_{dataset}" if per_dataset else table
+
+def source_path(table, dataset = None):
+    return os.path.join(DATA_DIR, TABLES[table][2].format(dataset = dataset))
+
+def source_signature(table, dataset = None):
+    filestat = os.stat(source_path(table, dataset))
+    return [filestat.st_size, filestat.st_mtime_ns]
+
+## Convert an array to a type np.save can write without pickling
+def to_storable(values):
+    values = np.asarray(values)
+    if values.dtype == object:
+        return values.astype(str)
+    return values
+
+def save_array(directory, name, values):
+    np.save(os.path.join(directory, name + ".npy"), to_storable(values), allow_pickle = False)
+
+def load_array(directory, name, mmap = False):
+    return np.load(os.path.join(directory, name + ".npy"), mmap_mode = "r" if mmap else None, allow_pickle = False)
+
+def save_column(directory, name, column):
+    if column.dtype == object:
+        save_array(directory, name + ".na", column.isna().to_numpy())
+        column = column.fillna("")
+    save_array(directory, name, column.to_numpy())
+
+def load_column(directory, name, dtype):
+    values = load_array(directory, name)
+    if dtype == "object":
+        values = values.astype(object)
+        values[load_array(directory, name + ".na")] = np.nan
+    return values
+
+def save_table(table, dataset, dataframe):
+    kind = TABLES[table][0]
+    directory = os.path.join(STORE_DIR, table_key(table, dataset))
+    building = directory + ".building"
+    shutil.rmtree(building, ignore_errors = True)
+    os.makedirs(building)
+
+    meta = {"kind": kind, "source": source_signature(table, dataset)}
+    if kind == "matrix":
+        save_array(building, "values", np.ascontiguousarray(dataframe.to_numpy()))
+        save_array(building, "index", dataframe.index.to_numpy())
+        save_array(building, "columns", dataframe.columns.to_numpy())
+        meta["index_name"] = dataframe.index.name
+        meta["index_dtype"] = str(dataframe.index.dtype)
+    else:
+        meta["columns"] = [str(column) for column in dataframe.columns]
+        meta["dtypes"] = [str(dtype) for dtype in dataframe.dtypes]
+        for position, column in enumerate(dataframe.columns):
+            save_column(building, str(position), dataframe[column])
+    with open(os.path.join(building, "meta.json"), "w") as meta_file:
+        json.dump(meta, meta_file)
+
+    ## Swap the finished table in, so readers never see a half written directory
+    shutil.rmtree(directory, ignore_errors = True)
+    os.rename(building, directory)
+
+def load_stored_table(table, dataset = None):
+    directory = os.path.join(STORE_DIR, table_key(table, dataset))
+    with open(os.path.join(directory, "meta.json")) as meta_file:
+        meta = json.load(meta_file)
+    if meta["source"] != source_signature(table, dataset):
+        return None
+
+    if meta["kind"] == "matrix":
+        index = pd.Index(load_array(directory, "index"), name = meta["index_name"])
+        if meta["index_dtype"] == "object":
+            index = index.astype(object)
+        columns = pd.Index(load_array(directory, "columns").astype(object))
+        values = load_array(directory, "values", mmap = STORE_MMAP)
+        return pd.DataFrame(values, index = index, columns = columns, copy = False)
+
+    return pd.DataFrame({column: load_column(directory, str(position), dtype)
+                         for position, (column, dtype) in enumerate(zip(meta["columns"], meta["dtypes"]))})
+
+## Load a table from the store, falling back to the CSV
+def load(table, dataset = None):
+    if os.path.exists(os.path.join(STORE_DIR, table_key(table, dataset), "meta.json")):
+        dataframe = load_stored_table(table, dataset)
+        if dataframe is not None:
+            return dataframe
+    return TABLES[table][1](dataset)
+
+## Convert every available CSV into the store
+def build():
+    os.makedirs(STORE_DIR, exist_ok = True)
+    for table, (kind, reader, pattern, per_dataset) in TABLES.items():
+        for dataset in (DATASETS if per_dataset else [None]):
+            if not os.path.exists(source_path(table, dataset)):
+                print(f"Skipping {table_key(table, dataset)}: {source_path(table, dataset)} not found")
+                continue
+            save_table(table, dataset, reader(dataset))
+            print(f"Stored {table_key(table, dataset)}")
+
+
+if __name__ == '__main__':
+    build()
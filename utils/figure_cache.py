@@ -0,0 +1,282 @@
+# Memoizing cache for callback outputs (figures, dropdown options)
+#
+# All inputs to the dashboard are read-only tables, so a callback called with the
+# same arguments always returns the same output. Outputs are kept as serialised JSON
+# in two tiers: a small in-process LRU, and an sqlite file shared by every worker
+# process on the machine. Both tiers are bounded in bytes and evict least recently used.
+# Keys carry a fingerprint of the input files and of the code, so outputs are drawn again
+# when either changes.
+
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from plotly.io.json import to_json_plotly
+
+from utils import datastore
+
+## Shared cache file (dash_cache_path, empty for the in-process tier only) and the byte bounds
+## of the file and in-process tiers (dash_cache_bytes, dash_memory_cache_bytes)
+CACHE_PATH = os.environ.get("dash_cache_path", os.path.join(tempfile.gettempdir(), "cellline_metabolomics_figures.sqlite"))
+CACHE_BYTES = int(os.environ.get("dash_cache_bytes", 512 * 1024 * 1024))
+MEMORY_CACHE_BYTES = int(os.environ.get("dash_memory_cache_bytes", 64 * 1024 * 1024))
+
+## Shared counters are written in batches: after this many lookups or seconds, whichever comes first
+COUNTER_FLUSH_LOOKUPS = 100
+COUNTER_FLUSH_SECONDS = 10
+
+## A disk hit only refreshes the entry's access time (a write) when it is older than this
+ACCESS_RESOLUTION_SECONDS = 60
+
+
+## Fingerprint of the input files, so cached outputs are dropped when the data changes
+def data_fingerprint(data_dir = datastore.DATA_DIR):
+    fingerprint = hashlib.sha1()
+    if os.path.isdir(data_dir):
+        for filename in sorted(os.listdir(data_dir)):
+            filepath = os.path.join(data_dir, filename)
+            if os.path.isfile(filepath):
+                filestat = os.stat(filepath)
+                fingerprint.update(f"{filename}:{filestat.st_size}:{filestat.st_mtime_ns};".encode())
+    return fingerprint.hexdigest()[:16]
+
+
+## Fingerprint of the code drawing the cached outputs (main.py, the pages and utils), so outputs
+## cached by an earlier deploy are not served after the code changes
+def code_fingerprint(root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))):
+    fingerprint = hashlib.sha1()
+    paths = [os.path.join(root, "main.py")]
+    for directory in ("pages", "utils"):
+        paths += sorted(os.path.join(root, directory, filename) for filename in os.listdir(os.path.join(root, directory))
+                        if filename.endswith(".py"))
+    for path in paths:
+        with open(path, "rb") as source_file:
+            fingerprint.update(f"{os.path.relpath(path, root)}:{hashlib.sha1(source_file.read()).hexdigest()};".encode())
+    return fingerprint.hexdigest()[:16]
+
+
+## In-process LRU bounded by the total size of the stored payloads
+class MemoryBackend:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            payload = self.entries.get(key)
+            if payload is not None:
+                self.entries.move_to_end(key)
+            return payload
+
+    def set(self, key, payload):
+        if len(payload) > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= len(previous)
+            self.entries[key] = payload
+            self.total_bytes += len(payload)
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last = False)
+                self.total_bytes -= len(evicted)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "bytes": self.total_bytes}
+
+
+## sqlite backed LRU shared between processes, bounded by the total size of the stored payloads.
+## Reads only write when an access time is stale; the total size is kept in the totals table.
+class SqliteBackend:
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.local = threading.local()
+        with self.connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS figures (key TEXT PRIMARY KEY, payload BLOB, size INTEGER, accessed REAL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS figures_accessed ON figures (accessed)")
+            connection.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)")
+            connection.execute("CREATE TABLE IF NOT EXISTS totals (name TEXT PRIMARY KEY, value INTEGER)")
+            connection.execute("INSERT OR IGNORE INTO totals SELECT 'bytes', COALESCE(SUM(size), 0) FROM figures")
+
+    ## One connection per thread and per process (connections must not cross a fork)
+    def connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None or self.local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout = 30, isolation_level = None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+        return connection
+
+    def get(self, key):
+        connection = self.connection()
+        row = connection.execute("SELECT payload, accessed FROM figures WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if now - row[1] > ACCESS_RESOLUTION_SECONDS:
+            connection.execute("UPDATE figures SET accessed = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def set(self, key, payload):
+        if len(payload) > self.max_bytes:
+            return
+        connection = self.connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            previous = connection.execute("SELECT size FROM figures WHERE key = ?", (key,)).fetchone()
+            connection.execute("INSERT OR REPLACE INTO figures VALUES (?, ?, ?, ?)", (key, payload, len(payload), time.time()))
+            total_bytes = connection.execute("SELECT value FROM totals WHERE name = 'bytes'").fetchone()[0]
+            total_bytes += len(payload) - (previous[0] if previous else 0)
+            while total_bytes > self.max_bytes:
+                oldest = connection.execute("SELECT key, size FROM figures ORDER BY accessed LIMIT 64").fetchall()
+                for oldest_key, oldest_size in oldest:
+                    connection.execute("DELETE FROM figures WHERE key = ?", (oldest_key,))
+                    total_bytes -= oldest_size
+                    if total_bytes <= self.max_bytes:
+                        break
+            connection.execute("UPDATE totals SET value = ? WHERE name = 'bytes'", (total_bytes,))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    ## Add amounts ({name: amount}) to the shared counters, in one transaction
+    def increment(self, amounts):
+        connection = self.connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for name, amount in amounts.items():
+                connection.execute("INSERT INTO counters VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + ?",
+                                   (name, amount, amount))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def counters(self):
+        return dict(self.connection().execute("SELECT name, value FROM counters").fetchall())
+
+    def clear(self):
+        connection = self.connection()
+        connection.execute("DELETE FROM figures")
+        connection.execute("DELETE FROM counters")
+        connection.execute("UPDATE totals SET value = 0 WHERE name = 'bytes'")
+
+    def stats(self):
+        connection = self.connection()
+        entries = connection.execute("SELECT COUNT(*) FROM figures").fetchone()[0]
+        total_bytes = connection.execute("SELECT value FROM totals WHERE name = 'bytes'").fetchone()[0]
+        return {"entries": entries, "bytes": total_bytes}
+
+
+class FigureCache:
+    def __init__(self, path = CACHE_PATH, max_bytes = CACHE_BYTES, memory_bytes = MEMORY_CACHE_BYTES, version = None):
+        self.memory = MemoryBackend(memory_bytes)
+        self.disk = SqliteBackend(path, max_bytes) if path else None
+        self.version = version if version is not None else f"{data_fingerprint()}-{code_fingerprint()}"
+        self.counts = {"hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self.counts_lock = threading.Lock()
+        ## Counts not yet added to the shared counters, and when they were last added
+        self.pending = {}
+        self.flushed = time.monotonic()
+        ## Functions called as listener(name, hit) after every memoized lookup
+        self.listeners = []
+
+    def make_key(self, name, args):
+        key = json.dumps([name, self.version, args], default = str, sort_keys = True)
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    ## Count lookups in this process; the shared counters are updated in batches
+    def count(self, *names):
+        with self.counts_lock:
+            for name in names:
+                self.counts[name] += 1
+                self.pending[name] = self.pending.get(name, 0) + 1
+            due = (sum(self.pending.values()) >= COUNTER_FLUSH_LOOKUPS
+                   or time.monotonic() - self.flushed >= COUNTER_FLUSH_SECONDS)
+        if due:
+            self.flush_counts()
+
+    ## Add the pending counts of this process to the shared counters
+    def flush_counts(self):
+        with self.counts_lock:
+            pending, self.pending = self.pending, {}
+            self.flushed = time.monotonic()
+        if self.disk is not None and pending:
+            self.disk.increment(pending)
+
+    ## Returns the cached JSON payload for a key, or None
+    def get(self, key):
+        payload = self.memory.get(key)
+        if payload is not None:
+            self.count("hits", "memory_hits")
+            return payload
+        if self.disk is not None:
+            payload = self.disk.get(key)
+            if payload is not None:
+                self.memory.set(key, payload)
+                self.count("hits", "disk_hits")
+                return payload
+        self.count("misses")
+        return None
+
+    def set(self, key, payload):
+        self.memory.set(key, payload)
+        if self.disk is not None:
+            self.disk.set(key, payload)
+
+    ## Decorator: serve a function's output from the cache, keyed by (name, data and code version, arguments)
+    def memoize(self, name):
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args):
+                key = self.make_key(name, args)
+                payload = self.get(key)
+                for listener in self.listeners:
+                    listener(name, payload is not None)
+                if payload is not None:
+                    return json.loads(payload)
+                result = function(*args)
+                ## Serialised as Dash serialises callback responses, so cached and uncached responses are identical
+                self.set(key, to_json_plotly(result).encode())
+                return result
+            return wrapper
+        return decorator
+
+    def clear(self):
+        self.memory.clear()
+        with self.counts_lock:
+            self.pending = {}
+        if self.disk is not None:
+            self.disk.clear()
+
+    ## Hit/miss counters for this process and (when the disk tier is enabled) for all processes
+    ## (up to the counts other processes have not flushed yet)
+    def stats(self):
+        self.flush_counts()
+        with self.counts_lock:
+            stats = {"process": dict(self.counts), "memory": self.memory.stats()}
+        if self.disk is not None:
+            stats["shared"] = self.disk.counters()
+            stats["disk"] = self.disk.stats()
+        return stats
+
+
+figure_cache = FigureCache()
@@ -0,0 +1,85 @@
+# Compact payloads for the heatmaps
+#
+# In "json" mode (the default) a heatmap is a plotly heatmap trace and every value is
+# sent to the browser as a JSON number. In "png" mode (dash_heatmap_payload=png) the
+# values are coloured on the server and sent as one palette PNG image trace, about a
+# byte per cell. The values themselves travel separately as a base64 array of uint8
+# codes (256 steps over the data range) in a dcc.Store, read by a clientside hover
+# callback (assets/heatmap.js).
+# (The plotly.js bundled with this Dash version cannot read binary arrays in figures.)
+
+import base64
+import io
+import math
+import os
+
+import numpy as np
+import plotly.graph_objects as go
+from PIL import Image
+
+## Heatmap payload (dash_heatmap_payload): "json" number arrays or "png" images
+PAYLOAD = os.environ.get("dash_heatmap_payload", "json")
+
+## Most axis labels drawn for an image heatmap (every label is still shown on hover)
+MAX_TICKS = 80
+
+## Code of missing values, in the quantized arrays and the image palette
+MISSING = 255
+
+
+## Palette PNG (as a data URI) of values on an evenly spaced colour scale between zmin and zmax
+## (nearest colour, values outside the range clipped, missing values transparent)
+def png_source(z, colours, zmin, zmax):
+    colours = [colours[i] for i in np.linspace(0, len(colours) - 1, min(len(colours), MISSING)).round().astype(int)]
+    missing = ~np.isfinite(z)
+    positions = (np.where(missing, zmin, z) - zmin) / (zmax - zmin) * (len(colours) - 1)
+    indexes = np.clip(np.rint(positions), 0, len(colours) - 1).astype(np.uint8)
+    indexes[missing] = MISSING
+
+    image = Image.fromarray(indexes, mode = "P")
+    image.putpalette([int(colour[i:i + 2], 16) for colour in colours for i in (1, 3, 5)])
+    buffer = io.BytesIO()
+    image.save(buffer, format = "PNG", optimize = True, transparency = MISSING)
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+## Values as base64 uint8 codes: value = offset + code * scale
+def quantize(z):
+    z = np.asarray(z, dtype = np.float64)
+    finite = np.isfinite(z)
+    offset = float(z[finite].min()) if finite.any() else 0.0
+    top = float(z[finite].max()) if finite.any() else 0.0
+    scale = (top - offset) / (MISSING - 1) if top > offset else 1.0
+    codes = np.full(z.shape, MISSING, dtype = np.uint8)
+    codes[finite] = np.rint((z[finite] - offset) / scale)
+    return {"values": base64.b64encode(codes.tobytes()).decode(), "offset": offset, "scale": scale,
+            "rows": z.shape[0], "columns": z.shape[1]}
+
+
+## Labels at most MAX_TICKS positions along an axis of an image heatmap
+def axis_ticks(labels):
+    step = max(1, math.ceil(len(labels) / MAX_TICKS))
+    positions = list(range(0, len(labels), step))
+    return dict(tickmode = "array", tickvals = positions, ticktext = [labels[i] for i in positions])
+
+
+## Heatmap of z (rows x columns) as a PNG image trace with a colour bar. labels names the
+## axes and colour bar (keys x, y, color); hover_names the same in the hover text, if different.
+## Returns the figure and the hover lookup for the Store read by assets/heatmap.js
+def image_heatmap(z, x, y, colours, zmin, zmax, labels, hover_names = None, title = None, colorbar = None):
+    x = [str(label) for label in x]
+    y = [str(label) for label in y]
+    figure = go.Figure(go.Image(source = png_source(z, colours, zmin, zmax), x0 = 0, dx = 1, y0 = 0, dy = 1,
+                                hoverinfo = "none"))
+    figure.update_layout(title = title, margin = dict(t = 60))
+
+    ## An empty scatter trace carries the colour bar (image traces have none)
+    figure.add_trace(go.Scatter(x = [None], y = [None], mode = "markers", showlegend = False, hoverinfo = "skip",
+                                marker = dict(colorscale = list(colours), cmin = zmin, cmax = zmax, color = [zmin],
+                                              showscale = True, colorbar = dict(title = labels["color"], **(colorbar or {})))))
+    figure.update_xaxes(title = labels["x"], **axis_ticks(x))
+    figure.update_yaxes(title = labels["y"], autorange = "reversed", **axis_ticks(y))
+
+    lookup = quantize(z)
+    lookup.update(x = x, y = y, labels = hover_names or labels)
+    return figure, lookup
@@ -0,0 +1,37 @@
+# Row and column access to stored matrices
+#
+# A Matrix wraps the values of a loaded table (usually a read-only memory map) with its
+# labels and the sign the pages show it with. Rows and columns are handed out as views
+# of the stored values; only a negated matrix allocates, and then only the one vector.
+
+import pandas as pd
+
+
+class Matrix:
+    def __init__(self, dataframe, sign = 1):
+        self.values = dataframe.to_numpy()
+        self.index = dataframe.index
+        self.columns = dataframe.columns
+        self.sign = sign
+
+    def signed(self, values):
+        return values if self.sign > 0 else -values
+
+    def row_values(self, label):
+        return self.signed(self.values[self.index.get_loc(label)])
+
+    def column_values(self, label):
+        return self.signed(self.values[:, self.columns.get_loc(label)])
+
+    ## Row as a Series over the columns, named by its label
+    def row(self, label):
+        return pd.Series(self.row_values(label), index = self.columns, name = label, copy = False)
+
+    ## Column as a Series over the index, named by its label
+    def column(self, label):
+        return pd.Series(self.column_values(label), index = self.index, name = label, copy = False)
+
+    @property
+    def shape(self):
+        return self.values.shape
+
@@ -0,0 +1,158 @@
+# Per-callback latency, payload size and cache metrics
+#
+# instrument(app) wraps every callback registered on the app, and:
+#   - records a latency histogram and a response size histogram per callback output
+#   - counts figure cache hits/misses per cached callback
+#   - serves everything at /metrics in the Prometheus text format
+#   - adds a Server-Timing header to callback responses, visible in browser devtools
+# Metrics are kept per process; with several workers each scrape sees one of them.
+
+import functools
+import os
+import threading
+import time
+
+import flask
+from dash.exceptions import PreventUpdate
+
+from utils.figure_cache import figure_cache
+
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+SIZE_BUCKETS = [1e3, 1e4, 1e5, 1e6, 1e7, 1e8]
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for position, bucket in enumerate(self.buckets):
+            if value <= bucket:
+                self.counts[position] += 1
+        self.total += value
+        self.count += 1
+
+    ## Prometheus exposition lines for this histogram
+    def lines(self, name, labels):
+        lines = []
+        for bucket, count in zip(self.buckets, self.counts):
+            lines.append(f'{name}_bucket{{{labels},le="{bucket:g}"}} {count}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f'{name}_sum{{{labels}}} {self.total:g}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = {}
+        self.response_bytes = {}
+        self.outcomes = {}
+        self.cache = {}
+
+    def record_callback(self, callback, seconds, size, outcome):
+        with self.lock:
+            if callback not in self.latency:
+                self.latency[callback] = Histogram(LATENCY_BUCKETS)
+                self.response_bytes[callback] = Histogram(SIZE_BUCKETS)
+            self.latency[callback].observe(seconds)
+            if size is not None:
+                self.response_bytes[callback].observe(size)
+            self.outcomes[(callback, outcome)] = self.outcomes.get((callback, outcome), 0) + 1
+
+    def record_cache(self, name, hit):
+        with self.lock:
+            key = (name, "hit" if hit else "miss")
+            self.cache[key] = self.cache.get(key, 0) + 1
+        if flask.has_request_context():
+            flask.g.setdefault("cache_results", []).append((name, hit))
+
+    def render(self):
+        lines = []
+        with self.lock:
+            lines.append("# HELP dash_callback_duration_seconds Time spent running a callback, including serialisation")
+            lines.append("# TYPE dash_callback_duration_seconds histogram")
+            for callback, histogram in sorted(self.latency.items()):
+                lines.extend(histogram.lines("dash_callback_duration_seconds", f'callback="{callback}"'))
+
+            lines.append("# HELP dash_callback_response_bytes Size of the serialised callback response")
+            lines.append("# TYPE dash_callback_response_bytes histogram")
+            for callback, histogram in sorted(self.response_bytes.items()):
+                lines.extend(histogram.lines("dash_callback_response_bytes", f'callback="{callback}"'))
+
+            lines.append("# HELP dash_callback_calls_total Callback calls by outcome (ok, prevented, error)")
+            lines.append("# TYPE dash_callback_calls_total counter")
+            for (callback, outcome), count in sorted(self.outcomes.items()):
+                lines.append(f'dash_callback_calls_total{{callback="{callback}",outcome="{outcome}"}} {count}')
+
+            lines.append("# HELP dash_figure_cache_requests_total Figure cache lookups by cached callback and result")
+            lines.append("# TYPE dash_figure_cache_requests_total counter")
+            for (name, result), count in sorted(self.cache.items()):
+                lines.append(f'dash_figure_cache_requests_total{{cache="{name}",result="{result}"}} {count}')
+
+        cache_stats = figure_cache.stats()
+        lines.append("# HELP dash_figure_cache_bytes Bytes held by each figure cache tier")
+        lines.append("# TYPE dash_figure_cache_bytes gauge")
+        for tier in ("memory", "disk"):
+            if tier in cache_stats:
+                lines.append(f'dash_figure_cache_bytes{{tier="{tier}"}} {cache_stats[tier]["bytes"]}')
+        lines.append("# HELP dash_process_info Process serving this scrape")
+        lines.append("# TYPE dash_process_info gauge")
+        lines.append(f'dash_process_info{{pid="{os.getpid()}"}} 1')
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+## Wrap a registered callback (the function Dash calls with the request's arguments)
+def instrument_callback(callback_id, callback):
+    @functools.wraps(callback)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        outcome, size = "ok", None
+        try:
+            response = callback(*args, **kwargs)
+            size = len(response) if isinstance(response, (str, bytes)) else None
+            return response
+        except PreventUpdate:
+            outcome = "prevented"
+            raise
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            metrics.record_callback(callback_id, seconds, size, outcome)
+            if flask.has_request_context():
+                flask.g.setdefault("callback_timings", []).append((callback_id, seconds))
+    return wrapper
+
+
+## Server-Timing header for a callback response: its duration and any cache lookups
+def server_timing(response):
+    entries = []
+    for position, (callback_id, seconds) in enumerate(flask.g.get("callback_timings", [])):
+        entries.append(f'callback{position};desc="{callback_id}";dur={seconds * 1000:.2f}')
+    for position, (name, hit) in enumerate(flask.g.get("cache_results", [])):
+        entries.append(f'cache{position};desc="{name} {"hit" if hit else "miss"}"')
+    if entries:
+        response.headers["Server-Timing"] = ", ".join(entries)
+    return response
+
+
+def instrument(app):
+    for callback_id, callback_spec in app.callback_map.items():
+        if "callback" in callback_spec:
+            callback_spec["callback"] = instrument_callback(callback_id, callback_spec["callback"])
+
+    figure_cache.listeners.append(metrics.record_cache)
+    app.server.after_request(server_timing)
+
+    @app.server.route("/metrics")
+    def metrics_endpoint():
+        return flask.Response(metrics.render(), mimetype = "text/plain; version=0.0.4")
@@ -0,0 +1,45 @@
+# Precomputed sort orders for every row and every column of a matrix
+#
+# The ranking plots show one row (or column) of a matrix sorted by value. Sorting every
+# row and column once when the matrix is loaded lets a request read its ranking with a
+# single fancy index instead of slicing, transposing and sorting the matrix.
+
+import numpy as np
+
+from utils.matrices import Matrix
+
+
+## Smallest unsigned integer type able to hold positions up to length
+def position_dtype(length):
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if length <= np.iinfo(dtype).max:
+            return dtype
+    return np.uint64
+
+
+class Rankings(Matrix):
+    def __init__(self, dataframe, sign = 1):
+        super().__init__(dataframe, sign)
+        values = self.values if self.sign > 0 else -self.values
+        ## row_order[i] sorts row i, column_order[j] sorts column j (signed values ascending, NaNs last, ties in file order)
+        self.row_order = np.argsort(values, axis = 1, kind = "stable").astype(position_dtype(values.shape[1]))
+        self.column_order = np.ascontiguousarray(np.argsort(values, axis = 0, kind = "stable").astype(position_dtype(values.shape[0])).T)
+
+    ## Labels and signed values of a row, sorted ascending
+    def sorted_row(self, label):
+        position = self.index.get_loc(label)
+        row_values = self.values[position]
+        order = self.row_order[position]
+        return self.columns[order], self.signed(row_values[order])
+
+    ## Labels and signed values of a column, sorted ascending
+    def sorted_column(self, label):
+        position = self.columns.get_loc(label)
+        column_values = self.values[:, position]
+        order = self.column_order[position]
+        return self.index[order], self.signed(column_values[order])
+
+
+## Ranking as plotting columns: rank (from 1), value and label
+def ranking_frame(labels, values, rank_name, value_name, label_name):
+    return {rank_name: np.arange(1, len(values) + 1), value_name: values, label_name: np.asarray(labels)}
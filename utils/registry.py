@@ -0,0 +1,76 @@
+# Lazily loaded tables and derived structures, per dataset
+#
+# Nothing is read when the pages are imported. The first callback that asks for a
+# (name, dataset) pair loads it - from the data store for the input tables, or
+# through a builder registered by a page for derived structures - and later callers
+# get the same object. Concurrent first requests for one pair wait for a single load.
+# A production server calls warm() once before forking its workers, so they start
+# with every structure loaded and share it copy-on-write (see wsgi.py).
+
+import threading
+
+from utils import datastore
+
+
+class Registry:
+    def __init__(self):
+        self.builders = {}
+        ## builder name -> built once per dataset (True) or once for all of them
+        self.per_dataset = {}
+        self.values = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    ## Decorator: register builder(dataset) as the loader for a derived structure
+    def builder(self, name, per_dataset = True):
+        def decorator(function):
+            self.builders[name] = function
+            self.per_dataset[name] = per_dataset
+            return function
+        return decorator
+
+    def load(self, name, dataset):
+        if name in self.builders:
+            return self.builders[name](dataset)
+        if name in datastore.TABLES:
+            if datastore.TABLES[name][3] and dataset not in datastore.DATASETS:
+                raise KeyError(f"Unknown dataset {dataset!r} for {name}")
+            return datastore.load(name, dataset)
+        raise KeyError(f"Unknown table {name!r}")
+
+    def get(self, name, dataset = None):
+        key = (name, dataset)
+        try:
+            return self.values[key]
+        except KeyError:
+            pass
+
+        with self.lock:
+            key_lock = self.locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if key not in self.values:
+                self.values[key] = self.load(name, dataset)
+        return self.values[key]
+
+    ## Load every table and registered structure for the given datasets (default: all),
+    ## skipping those whose input files are missing
+    def warm(self, datasets = None):
+        datasets = datasets or datastore.DATASETS
+        names = [(name, table[3]) for name, table in datastore.TABLES.items()]
+        names += list(self.per_dataset.items())
+        for name, per_dataset in names:
+            for dataset in (datasets if per_dataset else [None]):
+                try:
+                    self.get(name, dataset)
+                except OSError as error:
+                    print(f"Could not load {name} for {dataset}: {error}")
+        return self.loaded()
+
+    def is_loaded(self, name, dataset = None):
+        return (name, dataset) in self.values
+
+    def loaded(self):
+        return sorted(self.values, key = str)
+
+
+registry = Registry()
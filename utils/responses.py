@@ -0,0 +1,67 @@
+# Compression and validators for the app's JSON responses
+#
+# enable(app) turns on Flask-Compress for the callback, layout and HTML responses
+# (Brotli when the browser accepts it, gzip otherwise; responses smaller than
+# COMPRESS_MIN_BYTES are sent as they are), and gives the callback and layout responses
+# a strong ETag of their uncompressed body. Callback outputs are pure functions of the
+# request, so a request repeated with the ETag of its earlier response in If-None-Match
+# is answered with 304 Not Modified and no body. The layout GETs are revalidated this
+# way by the browser cache; assets/etag_cache.js does the same for callback POSTs.
+
+import hashlib
+import os
+
+import flask
+from flask_compress import Compress
+from werkzeug.http import remove_entity_headers
+
+## Compression of responses (dash_compress) of at least dash_compress_min_bytes, and ETags (dash_etags)
+COMPRESS = os.environ.get("dash_compress", "True") == "True"
+COMPRESS_MIN_BYTES = int(os.environ.get("dash_compress_min_bytes", 1024))
+ETAGS = os.environ.get("dash_etags", "True") == "True"
+
+ALGORITHMS = ["br", "gzip"]
+
+## Dash endpoints whose responses get an ETag
+VALIDATED_ROUTES = ("_dash-update-component", "_dash-layout", "_dash-dependencies")
+
+
+## Strong ETag of a response body
+def body_etag(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+## Whether If-None-Match holds the ETag, as sent or with the suffix Flask-Compress
+## appends for the encoding it chose (e.g. "abc:br")
+def etag_matches(request, etag):
+    return any(request.if_none_match.contains(tag) for tag in [etag] + [f"{etag}:{algorithm}" for algorithm in ALGORITHMS])
+
+
+## after_request handler: ETag on validated routes, and 304 when the client already has the body
+def conditional_response(response):
+    request = flask.request
+    if (response.status_code != 200 or response.is_streamed or response.direct_passthrough
+            or not request.path.endswith(VALIDATED_ROUTES)):
+        return response
+
+    etag = body_etag(response.get_data())
+    response.set_etag(etag)
+    if request.method == "GET":
+        response.cache_control.no_cache = True
+    if etag_matches(request, etag):
+        response.status_code = 304
+        response.set_data(b"")
+        remove_entity_headers(response.headers)
+    return response
+
+
+def enable(app):
+    server = app.server
+    ## Handlers run in reverse order of registration: the ETag is set (and a 304
+    ## answered) on the uncompressed body before Flask-Compress encodes it
+    if COMPRESS:
+        server.config.update(COMPRESS_ALGORITHM = ALGORITHMS, COMPRESS_MIN_SIZE = COMPRESS_MIN_BYTES,
+                             COMPRESS_MIMETYPES = ["application/json", "text/html", "text/css", "application/javascript"])
+        Compress(server)
+    if ETAGS:
+        server.after_request(conditional_response)
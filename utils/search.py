@@ -0,0 +1,86 @@
+# Typeahead search for dropdowns with many options
+#
+# Dropdowns with thousands of options load them on demand from their search_value
+# instead of shipping all of them. SearchIndex is built once per option list from
+# the strings each option can be found by (e.g. ion id, metabolite names, HMDB ids):
+# queries shorter than a trigram are prefix ranges of the sorted keys, longer ones
+# intersect the entries of each trigram of the query and keep those that contain it.
+# Matches are ranked exact, then prefix, then substring, then by option order; an empty
+# search returns only the selected option, so a layout embeds a single option.
+
+import numpy as np
+
+## Options returned per search
+TOP_K = 50
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    ## options: list of dropdown options ({"label", "value"}); keys: for each option, the strings it is found by
+    def __init__(self, options, keys):
+        self.options = []
+        self.positions = {}
+        ## Lower case keys of each option, separated (and surrounded) by newlines for exact/prefix checks
+        self.haystacks = []
+        postings = {}
+        sorted_keys = []
+        for position, (option, option_keys) in enumerate(zip(options, keys)):
+            option_keys = [str(key).lower() for key in option_keys if str(key)]
+            self.options.append(dict(option, search = " ".join([str(option["label"])] + option_keys)))
+            self.positions.setdefault(option["value"], position)
+            self.haystacks.append("\n" + "\n".join(option_keys) + "\n")
+            for key in option_keys:
+                sorted_keys.append((key, position))
+                for trigram in trigrams(key):
+                    postings.setdefault(trigram, []).append(position)
+
+        sorted_keys.sort()
+        self.sorted_keys = np.array([key for key, _ in sorted_keys], dtype = object)
+        self.sorted_positions = np.array([position for _, position in sorted_keys], dtype = np.int64)
+        self.postings = {trigram: np.unique(positions) for trigram, positions in postings.items()}
+
+    def __len__(self):
+        return len(self.options)
+
+    ## Positions of the options matching a query, best first
+    def search(self, query, limit = TOP_K):
+        query = query.strip().lower()
+        if not query:
+            return []
+
+        if len(query) < 3:
+            start = np.searchsorted(self.sorted_keys, query, side = "left")
+            stop = np.searchsorted(self.sorted_keys, query + "\uffff", side = "left")
+            candidates = np.unique(self.sorted_positions[start:stop])
+        else:
+            candidates = None
+            for trigram in sorted(trigrams(query), key = lambda trigram: len(self.postings.get(trigram, ()))):
+                positions = self.postings.get(trigram)
+                if positions is None:
+                    return []
+                candidates = positions if candidates is None else np.intersect1d(candidates, positions, assume_unique = True)
+
+        ranked = []
+        for position in candidates.tolist():
+            haystack = self.haystacks[position]
+            if "\n" + query + "\n" in haystack:
+                ranked.append((0, position))
+            elif "\n" + query in haystack:
+                ranked.append((1, position))
+            elif query in haystack:
+                ranked.append((2, position))
+        ranked.sort()
+        return [position for _, position in ranked[:limit]]
+
+    ## Dropdown options for a search_value, always including the selected value(s)
+    def dropdown_options(self, search_value, value = None, limit = TOP_K):
+        positions = self.search(search_value or "", limit)
+        selected = value if isinstance(value, list) else [value]
+        for selected_value in selected:
+            position = self.positions.get(selected_value)
+            if position is not None and position not in positions:
+                positions.append(position)
+        return [self.options[position] for position in positions]
@@ -0,0 +1,118 @@
+# Server-side paging, filtering and sorting for DataTables
+#
+# Tables with page_action, filter_action and sort_action set to "custom" send their
+# page, filter_query and sort_by to a callback instead of receiving every row.
+# PagedTable answers those from a frame with the stable sort order of each column
+# computed once: comparisons are a searchsorted range of a sorted column, "contains" a
+# vectorised string match, and sorting reuses precomputed orders (ascending and descending,
+# missing values last in both), so a request only converts one page of rows.
+
+import math
+
+import numpy as np
+import pandas as pd
+
+## filter_query operators (as DataTable writes them, then as typed), longest match first
+OPERATORS = [("ge", ">="), ("le", "<="), ("lt", "<"), ("gt", ">"), ("ne", "!="), ("eq", "="),
+             ("icontains",), ("scontains",), ("contains",), ("datestartswith",)]
+
+
+## (column, operator, value) of one part of a filter_query, e.g. '{score} >= 80' -> ("score", "ge", 80.0).
+## The operator is read right after {column}, so a value spelling an operator (e.g. "contains") stays a value.
+def split_filter_part(filter_part):
+    name_start = filter_part.find("{")
+    name_stop = filter_part.find("}", name_start + 1)
+    if name_start < 0 or name_stop < 0:
+        return None, None, None
+    name = filter_part[name_start + 1:name_stop]
+    expression = filter_part[name_stop + 1:].lstrip() + " "
+    for operator_names in OPERATORS:
+        for operator in operator_names:
+            if expression.startswith(f"{operator} "):
+                value_part = expression[len(operator):].strip()
+                if len(value_part) > 1 and value_part[0] == value_part[-1] and value_part[0] in ("'", '"', "`"):
+                    return name, operator_names[0], value_part[1:-1].replace("\\" + value_part[0], value_part[0])
+                try:
+                    return name, operator_names[0], float(value_part)
+                except ValueError:
+                    return name, operator_names[0], value_part
+    return None, None, None
+
+
+class PagedTable:
+    def __init__(self, frame):
+        self.frame = frame.reset_index(drop = True)
+        ## column -> sort keys (float or str), their stable sort order, the sorted keys and display strings
+        self.keys = {}
+        self.orders = {}
+        self.sorted_keys = {}
+        self.text = {}
+        ## (column, "asc"/"desc") -> stable order of the rows as sorted for display (missing values last)
+        self.sort_orders = {}
+        for column in self.frame.columns:
+            values = self.frame[column]
+            if pd.api.types.is_numeric_dtype(values):
+                keys = values.to_numpy(dtype = np.float64)
+            else:
+                keys = values.fillna("").astype(str).to_numpy()
+            self.keys[column] = keys
+            self.orders[column] = np.argsort(keys, kind = "stable")
+            self.sorted_keys[column] = keys[self.orders[column]]
+            self.text[column] = values.astype(str).where(values.notna(), "")
+            sort_keys = pd.Series(keys).where(values.notna().to_numpy())
+            for direction in ("asc", "desc"):
+                self.sort_orders[column, direction] = sort_keys.sort_values(
+                    ascending = direction == "asc", kind = "stable", na_position = "last").index.to_numpy()
+
+    def __len__(self):
+        return len(self.frame)
+
+    ## Boolean mask of the rows matching one filter condition
+    def matches(self, column, operator, value):
+        if operator in ("contains", "scontains", "icontains", "datestartswith"):
+            value = value if isinstance(value, str) else f"{value:g}"
+            if operator == "datestartswith":
+                return self.text[column].str.startswith(value).to_numpy()
+            return self.text[column].str.contains(value, case = operator != "icontains", regex = False).to_numpy()
+
+        keys = self.keys[column]
+        if keys.dtype.kind == "f":
+            try:
+                value = float(value)
+            except ValueError:
+                return np.zeros(len(self), dtype = bool)
+            valid = ~np.isnan(keys)
+        else:
+            value = value if isinstance(value, str) else f"{value:g}"
+            valid = np.ones(len(self), dtype = bool)
+
+        sorted_keys, order = self.sorted_keys[column], self.orders[column]
+        left = np.searchsorted(sorted_keys, value, side = "left")
+        right = np.searchsorted(sorted_keys, value, side = "right")
+        selected = {"eq": order[left:right], "ne": np.concatenate([order[:left], order[right:]]),
+                    "lt": order[:left], "le": order[:right], "gt": order[right:], "ge": order[left:]}[operator]
+        mask = np.zeros(len(self), dtype = bool)
+        mask[selected] = True
+        return mask & valid
+
+    ## Rows of one page (as records) and the number of pages, for a DataTable's
+    ## page_current, page_size, sort_by and filter_query (sorting uses the first sort column)
+    def page(self, page_current, page_size, sort_by = None, filter_query = ""):
+        mask = None
+        for filter_part in (filter_query or "").split(" && "):
+            column, operator, value = split_filter_part(filter_part)
+            if column in self.keys:
+                part_mask = self.matches(column, operator, value)
+                mask = part_mask if mask is None else mask & part_mask
+
+        if sort_by and sort_by[0]["column_id"] in self.orders:
+            order = self.sort_orders[sort_by[0]["column_id"], "desc" if sort_by[0]["direction"] == "desc" else "asc"]
+        else:
+            order = np.arange(len(self))
+        if mask is not None:
+            order = order[mask[order]]
+
+        page_count = max(1, math.ceil(len(order) / page_size))
+        page_current = min(page_current or 0, page_count - 1)
+        rows = self.frame.iloc[order[page_current * page_size:(page_current + 1) * page_size]]
+        return rows.to_dict("records"), page_count
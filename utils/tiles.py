@@ -0,0 +1,82 @@
+# Multi-resolution pyramid for large heatmaps
+#
+# Level 0 is the matrix itself; each further level halves both dimensions, keeping for
+# every 2x2 block the value with the largest absolute size (so strong associations
+# survive downsampling). A view of any region is served from the finest level whose
+# slice of that region fits in a cell budget: the whole matrix comes from a coarse
+# level, and zooming in fetches finer levels for just the visible region.
+
+import math
+
+import numpy as np
+
+
+## Max-abs pooling of 2x2 blocks (NaN padded to even size, NaNs ignored)
+def pool(values):
+    rows, columns = values.shape
+    padded = np.full((rows + rows % 2, columns + columns % 2), np.nan, dtype = np.float32)
+    padded[:rows, :columns] = values
+    blocks = padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2).transpose(0, 2, 1, 3)
+    blocks = blocks.reshape(blocks.shape[0], blocks.shape[1], 4)
+    magnitude = np.where(np.isnan(blocks), -1, np.abs(blocks))
+    return np.take_along_axis(blocks, magnitude.argmax(axis = 2)[:, :, None], axis = 2)[:, :, 0]
+
+
+class Pyramid:
+    def __init__(self, values, min_cells = 1024):
+        self.levels = [values]
+        while self.levels[-1].shape[0] * self.levels[-1].shape[1] > min_cells and max(self.levels[-1].shape) > 1:
+            self.levels.append(pool(self.levels[-1]))
+
+    @property
+    def shape(self):
+        return self.levels[0].shape
+
+    ## Finest level at which rows x columns of the full matrix fit in max_cells
+    def level_for(self, rows, columns, max_cells):
+        for level in range(len(self.levels)):
+            factor = 2 ** level
+            if math.ceil(rows / factor) * math.ceil(columns / factor) <= max_cells:
+                return level
+        return len(self.levels) - 1
+
+    ## Values for a region of the full matrix: (z, level, row_start, row_stop, column_start, column_stop)
+    ## The region is widened to the block boundaries of the chosen level.
+    def region(self, row_start, row_stop, column_start, column_stop, max_cells):
+        level = self.level_for(row_stop - row_start, column_stop - column_start, max_cells)
+        factor = 2 ** level
+        block_rows = slice(row_start // factor, math.ceil(row_stop / factor))
+        block_columns = slice(column_start // factor, math.ceil(column_stop / factor))
+        z = self.levels[level][block_rows, block_columns]
+        return (z, level, block_rows.start * factor, min(block_rows.stop * factor, self.shape[0]),
+                block_columns.start * factor, min(block_columns.stop * factor, self.shape[1]))
+
+
+## Axis labels for the blocks of a level: the label itself at full resolution,
+## otherwise the first and last label of each block
+def block_labels(labels, start, stop, factor):
+    labels = [str(label) for label in labels[start:stop]]
+    blocks = [labels[i:i + factor] for i in range(0, len(labels), factor)]
+    return [block[0] if len(block) == 1 else f"{block[0]}–{block[-1]}" for block in blocks]
+
+
+## Region of the full matrix shown after a zoom, from the plotly relayoutData of a figure
+## drawn for view (a dict with the row/column start and the level factor of its blocks).
+## Returns None to show the whole matrix, or the current view when the event is not a zoom.
+def zoom_region(relayout, view):
+    if not relayout or view is None:
+        return view
+    if "xaxis.autorange" in relayout or "yaxis.autorange" in relayout:
+        return None
+
+    region = dict(view)
+    for axis, start, stop in (("x", "column_start", "column_stop"), ("y", "row_start", "row_stop")):
+        if f"{axis}axis.range[0]" not in relayout:
+            continue
+        low, high = sorted([relayout[f"{axis}axis.range[0]"], relayout[f"{axis}axis.range[1]"]])
+        factor = view["factor"]
+        region[start] = max(view[start], view[start] + math.floor(low + 0.5) * factor)
+        region[stop] = min(view[stop], view[start] + (math.floor(high + 0.5) + 1) * factor)
+        if region[stop] <= region[start]:
+            return view
+    return region
@@ -0,0 +1,48 @@
+# Production entry point for a preforking WSGI server
+#
+#     gunicorn -c gunicorn.conf.py wsgi:server
+#
+# gunicorn.conf.py sets preload_app, so this module is imported once in the master
+# process: the callbacks are registered and the tables and derived structures of the
+# preloaded datasets, and the default page artifacts, are loaded here, before the workers
+# are forked. The workers then share that memory copy-on-write (and the memory-mapped data
+# store through the page cache) instead of each loading its own copy on its first
+# requests. Other datasets are still loaded lazily, by each worker that needs them.
+
+import gc
+import os
+import time
+
+from main import app
+from pages import page1, page2, page3, page4
+from utils.artifacts import artifacts, DEFAULTS
+from utils.registry import registry
+
+## Whether the master preloads (dash_preload), and which datasets (dash_preload_datasets, comma separated)
+PRELOAD = os.environ.get("dash_preload", "True") == "True"
+PRELOAD_DATASETS = [dataset.strip() for dataset in os.environ.get("dash_preload_datasets", "shorthouse").split(",")
+                    if dataset.strip()]
+
+server = app.server
+
+
+## Load the data of the preloaded datasets and the default outputs of every page
+## (which show the default dataset, so only when it is preloaded)
+def warm(datasets = PRELOAD_DATASETS):
+    start = time.perf_counter()
+    loaded = registry.warm(datasets) if datasets else []
+    pages = {"page1": page1.default_outputs, "page2": page2.default_outputs,
+             "page3": page3.default_outputs, "page4": page4.default_outputs}
+    for page, render in (pages.items() if DEFAULTS["dataset"] in datasets else []):
+        try:
+            artifacts.get(page, render)
+        except OSError as error:
+            print(f"Could not render the {page} artifact: {error}")
+    print(f"Loaded {len(loaded)} tables and structures in {time.perf_counter() - start:.1f}s")
+
+
+if PRELOAD:
+    warm()
+    ## Move the loaded objects out of the collector's generations, so collections in the
+    ## workers do not write to (and so copy) the pages they share with the master
+    gc.freeze()